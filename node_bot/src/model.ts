@@ -22,6 +22,9 @@ export interface Candle15m {
 interface ModelMetadata {
   feature_names: string[];
   n_features: number;
+  // Platt 校准参数 (train.py 写入)，ONNX 输出的是未校准概率
+  platt_a?: number;
+  platt_b?: number;
 }
 
 let session: ort.InferenceSession | null = null;
@@ -235,6 +238,19 @@ export function prepareFeatures(candles: Candle15m[]): Float32Array {
   return new Float32Array(features.slice(0, expectedFeatures));
 }
 
+/**
+ * Platt 校准: sigmoid(a * logit(p) + b)。元数据中没有校准参数时原样返回。
+ */
+function calibrate(p: number): number {
+  const a = metadata?.platt_a;
+  const b = metadata?.platt_b;
+  if (a === undefined || b === undefined) return p;
+
+  const clipped = Math.max(1e-6, Math.min(1 - 1e-6, p));
+  const z = a * Math.log(clipped / (1 - clipped)) + b;
+  return 1 / (1 + Math.exp(-z));
+}
+
 /**
  * 运行模型推理，返回 Up 的概率。
  */
@@ -251,7 +267,7 @@ export async function runModel(features: Float32Array): Promise<number> {
   // 调试：输出所有结果键
   log.debug(`[MODEL] 模型输出键: ${Object.keys(results).join(", ")}`);
 
-  // skl2onnx 输出: output_label, output_probability
+  // 导出的模型输出 (skl2onnx 命名): output_label, output_probability
   const probabilities = results["output_probability"];
 
   if (probabilities) {
@@ -286,6 +302,8 @@ export async function runModel(features: Float32Array): Promise<number> {
         probUp = 0.5;
       }
       
+      probUp = calibrate(probUp);
+
       // 限制概率范围，避免极端值
       probUp = Math.max(0.05, Math.min(0.95, probUp));
       
@@ -0,0 +1,164 @@
+"""
+Numba kernels for hot numeric loops.
+
+Each kernel fuses several NumPy passes into a single compiled loop. When
+numba is not installed the same names are bound to vectorized NumPy
+(or, for the recursive EWMAs, pandas) equivalents, so callers never need
+to check HAS_NUMBA themselves.
+"""
+
+import numpy as np
+import pandas as pd
+
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:
+    njit = None
+    HAS_NUMBA = False
+
+
+if HAS_NUMBA:
+    @njit(cache=True)
+    def equity_curve(returns: np.ndarray) -> np.ndarray:
+        """Compounded equity starting at 1.0 (len(returns) + 1 points)."""
+        out = np.empty(len(returns) + 1)
+        out[0] = 1.0
+        for i in range(len(returns)):
+            out[i + 1] = out[i] * (1.0 + returns[i])
+        return out
+
+    @njit(cache=True)
+    def max_drawdown(equity: np.ndarray) -> float:
+        """Largest peak-to-trough drop as a fraction of the peak."""
+        peak = equity[0]
+        mdd = 0.0
+        for x in equity:
+            if x > peak:
+                peak = x
+            else:
+                dd = (peak - x) / (peak + 1e-10)
+                if dd > mdd:
+                    mdd = dd
+        return mdd
+
+    @njit(cache=True)
+    def mean_std(x: np.ndarray) -> tuple[float, float]:
+        """Mean and population std in one Welford pass."""
+        mean = 0.0
+        m2 = 0.0
+        for i in range(len(x)):
+            delta = x[i] - mean
+            mean += delta / (i + 1)
+            m2 += delta * (x[i] - mean)
+        return mean, np.sqrt(m2 / len(x))
+
+    @njit(cache=True)
+    def ewma(x: np.ndarray, alpha: float) -> np.ndarray:
+        """Recursive EWMA, same as pandas ewm(alpha=alpha, adjust=False).mean()."""
+        out = np.empty(len(x))
+        if len(x) == 0:
+            return out
+        prev = x[0]
+        out[0] = prev
+        for i in range(1, len(x)):
+            prev = alpha * x[i] + (1.0 - alpha) * prev
+            out[i] = prev
+        return out
+
+    @njit(cache=True)
+    def ewmas(x: np.ndarray, alphas: np.ndarray) -> np.ndarray:
+        """One EWMA per alpha (one row each), all updated in a single pass over x."""
+        k = len(alphas)
+        out = np.empty((k, len(x)))
+        if len(x) == 0:
+            return out
+        prev = np.full(k, x[0])
+        out[:, 0] = prev
+        for i in range(1, len(x)):
+            for j in range(k):
+                prev[j] = alphas[j] * x[i] + (1.0 - alphas[j]) * prev[j]
+                out[j, i] = prev[j]
+        return out
+
+    @njit(cache=True)
+    def rolling_mean_std(x: np.ndarray, windows: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Rolling mean and sample std (ddof=1) for every window in one pass.
+
+        Each window keeps a running mean / sum of squared deviations, adding
+        the incoming value and removing the one that drops out (O(1) per
+        bar), the same update pandas rolling uses. NaNs are skipped and a row
+        is only filled once its window holds w valid values, so as in pandas
+        a missing bar blanks the next w rows rather than everything after
+        it. A window of identical values has std exactly 0.
+        """
+        k = len(windows)
+        n = len(x)
+        means = np.full((k, n), np.nan)
+        stds = np.full((k, n), np.nan)
+        for j in range(k):
+            w = windows[j]
+            mean = 0.0
+            m2 = 0.0
+            nobs = 0
+            same = 0
+            for i in range(n):
+                xi = x[i]
+                if not np.isnan(xi):
+                    nobs += 1
+                    delta = xi - mean
+                    mean += delta / nobs
+                    m2 += delta * (xi - mean)
+                if i > 0 and xi == x[i - 1]:
+                    same += 1
+                else:
+                    same = 1
+                if i >= w:
+                    xo = x[i - w]
+                    if not np.isnan(xo):
+                        nobs -= 1
+                        if nobs == 0:
+                            mean = 0.0
+                            m2 = 0.0
+                        else:
+                            delta = xo - mean
+                            mean -= delta / nobs
+                            m2 -= delta * (xo - mean)
+                if nobs == w:
+                    if same >= w:
+                        means[j, i] = xi
+                        stds[j, i] = 0.0
+                    else:
+                        means[j, i] = mean
+                        stds[j, i] = np.sqrt(max(m2, 0.0) / (w - 1))
+        return means, stds
+
+else:
+    def equity_curve(returns: np.ndarray) -> np.ndarray:
+        """Compounded equity starting at 1.0 (len(returns) + 1 points)."""
+        return np.concatenate(([1.0], np.cumprod(1.0 + returns)))
+
+    def max_drawdown(equity: np.ndarray) -> float:
+        """Largest peak-to-trough drop as a fraction of the peak."""
+        peak = np.maximum.accumulate(equity)
+        return np.max((peak - equity) / (peak + 1e-10))
+
+    def mean_std(x: np.ndarray) -> tuple[float, float]:
+        """Mean and population std."""
+        return np.mean(x), np.std(x)
+
+    def ewma(x: np.ndarray, alpha: float) -> np.ndarray:
+        """Recursive EWMA, same as pandas ewm(alpha=alpha, adjust=False).mean()."""
+        return pd.Series(x).ewm(alpha=alpha, adjust=False).mean().to_numpy()
+
+    def ewmas(x: np.ndarray, alphas: np.ndarray) -> np.ndarray:
+        """One EWMA per alpha (one row each)."""
+        return np.array([ewma(x, alpha) for alpha in alphas]).reshape(len(alphas), len(x))
+
+    def rolling_mean_std(x: np.ndarray, windows: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Rolling mean and sample std (ddof=1) for every window (one row each)."""
+        series = pd.Series(x)
+        means = np.array([series.rolling(w).mean().to_numpy() for w in windows]).reshape(len(windows), len(x))
+        stds = np.array([series.rolling(w).std().to_numpy() for w in windows]).reshape(len(windows), len(x))
+        return means, stds
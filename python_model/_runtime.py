@@ -0,0 +1,30 @@
+"""
+Optional-dependency probes shared by the training, backtest and data scripts.
+
+Each probe runs once at import, so callers read a flag instead of repeating
+the import checks.
+"""
+
+import importlib.util
+
+import xgboost as xgb
+
+try:
+    import cupy as cp
+except ImportError:
+    cp = None
+
+HAS_PARQUET = importlib.util.find_spec("pyarrow") is not None
+
+
+def pick_device() -> str:
+    """Train on the GPU when xgboost has CUDA support and CuPy sees a device, else CPU hist."""
+    if cp is None or not xgb.build_info().get("USE_CUDA"):
+        return "cpu"
+    try:
+        return "cuda" if cp.cuda.runtime.getDeviceCount() > 0 else "cpu"
+    except cp.cuda.runtime.CUDARuntimeError:
+        return "cpu"
+
+
+DEVICE = pick_device()
@@ -4,6 +4,9 @@ Walk-forward sliding window backtesting for BTC 15m prediction strategy.
 Calculates win rate, Sharpe ratio, and profit curve.
 """
 
+import hashlib
+import os
+import sqlite3
 from dataclasses import dataclass
 from pathlib import Path
 
@@ -11,9 +14,26 @@ import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 import xgboost as xgb
-
-from collect_data import load_data
-from features import build_features, get_feature_columns
+from joblib import Parallel, delayed
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+import _kernels
+import features
+from _kernels import equity_curve, max_drawdown, mean_std
+from _runtime import DEVICE, cp
+from collect_data import DATA_DIR, load_data
+from convert_to_onnx import convert_xgboost, xgboost_to_onnx
+from features import build_feature_matrix, get_feature_columns
+
+CACHE_DIR = Path(__file__).parent.parent / ".backtest_cache"
+CACHE_DB = CACHE_DIR / "predictions.sqlite"
 
 
 @dataclass
@@ -25,6 +45,12 @@ class BacktestConfig:
     min_confidence: float = 0.55      # Minimum prediction confidence
     position_size: float = 1.0        # Position size (1 = 100%)
     transaction_cost: float = 0.001   # 0.1% per trade
+    n_estimators: int = 300           # Upper bound on rounds for windows trained from scratch
+    early_stopping_rounds: int = 10   # Stop once the held-out train tail stops improving (0 = off)
+    warm_start_rounds: int = 10       # Rounds appended per later window (0 = retrain from scratch)
+    use_cache: bool = True            # Reuse cached window models/predictions across reruns
+    n_jobs: int = 1                   # Parallel CPU windows when warm_start_rounds == 0 (-1 = all cores)
+    onnx_inference: bool = False      # Predict sequential windows with ONNX Runtime instead of XGBoost
 
 
 @dataclass
@@ -37,25 +63,143 @@ class BacktestResult:
     total_return: float
     sharpe_ratio: float
     max_drawdown: float
-    profit_curve: list[float]
-    predictions: list[dict]
-
-
-def train_window_model(X_train: np.ndarray, y_train: np.ndarray) -> xgb.XGBClassifier:
-    """Train a model on a single window."""
-    model = xgb.XGBClassifier(
-        objective="binary:logistic",
-        n_estimators=100,
-        max_depth=4,
-        learning_rate=0.1,
-        subsample=0.8,
-        colsample_bytree=0.8,
-        random_state=42,
-        n_jobs=-1,
-        verbosity=0,
+    profit_curve: np.ndarray
+    # Per-trade records, stored column-wise
+    pred_window: np.ndarray   # Walk-forward window number
+    pred_index: np.ndarray    # Row index into the feature matrix
+    pred_pred: np.ndarray     # Predicted class (1 = up)
+    pred_actual: np.ndarray   # Actual class
+    pred_conf: np.ndarray     # Confidence of the predicted class
+    pred_return: np.ndarray   # Trade return after costs
+
+
+# Shared booster parameters for every walk-forward window
+WINDOW_PARAMS = {
+    "objective": "binary:logistic",
+    "tree_method": "hist",
+    "device": DEVICE,
+    "max_bin": 256,
+    "max_depth": 4,
+    "learning_rate": 0.1,
+    "subsample": 0.8,
+    "colsample_bytree": 0.8,
+    "seed": 42,
+    # Reseed sampling from the round number rather than the process-global RNG, so a
+    # window warm-started from a cached booster grows the same trees as in a full run
+    "seed_per_iteration": True,
+    "verbosity": 0,
+}
+
+# Independent windows run one per core, so each booster gets a single thread
+PARALLEL_WINDOW_PARAMS = {**WINDOW_PARAMS, "device": "cpu", "nthread": 1}
+
+
+def train_window_model(
+    dtrain: xgb.DMatrix,
+    num_boost_round: int = 100,
+    prev_booster: xgb.Booster | None = None,
+    params: dict = WINDOW_PARAMS,
+    deval: xgb.DMatrix | None = None,
+    early_stopping_rounds: int = 0,
+) -> xgb.Booster:
+    """
+    Train a model on a single window.
+
+    Consecutive windows share most of their training data, so when
+    prev_booster is given the new rounds are appended on top of it
+    instead of regrowing every tree from scratch.
+
+    With deval, num_boost_round is only an upper bound: training stops once
+    the validation log-loss has not improved for early_stopping_rounds, and
+    the trees past the best round are dropped.
+    """
+    if deval is None:
+        return xgb.train(
+            params,
+            dtrain,
+            num_boost_round=num_boost_round,
+            xgb_model=prev_booster,
+        )
+    booster = xgb.train(
+        params,
+        dtrain,
+        num_boost_round=num_boost_round,
+        evals=[(deval, "eval")],
+        early_stopping_rounds=early_stopping_rounds,
+        xgb_model=prev_booster,
+        verbose_eval=False,
+    )
+    return booster[: booster.best_iteration + 1]
+
+
+def onnx_session(booster: xgb.Booster, n_features: int) -> "ort.InferenceSession":
+    """Export a window booster to ONNX and open a fully optimized ONNX Runtime session."""
+    sess_options = ort.SessionOptions()
+    sess_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    sess_options.intra_op_num_threads = os.cpu_count()
+    sess_options.enable_mem_pattern = True
+    onnx_model = xgboost_to_onnx(booster, n_features)
+    return ort.InferenceSession(
+        onnx_model.SerializeToString(), sess_options, providers=["CPUExecutionProvider"],
+    )
+
+
+def window_cache_key(
+    X_train: np.ndarray,
+    y_train: np.ndarray,
+    X_test: np.ndarray,
+    num_boost_round: int,
+    parent_key: str = "",
+    params: dict = WINDOW_PARAMS,
+    early_stopping_rounds: int = 0,
+) -> str:
+    """
+    Content hash of everything a window's predictions depend on.
+
+    parent_key chains warm-started windows to the window they continue
+    from, so a change early in the history invalidates everything after it,
+    while appending new data leaves every earlier window's key unchanged.
+    """
+    h = xxhash.xxh3_128() if xxhash is not None else hashlib.blake2b(digest_size=16)
+    h.update(parent_key.encode())
+    h.update(np.ascontiguousarray(X_train))
+    h.update(np.ascontiguousarray(y_train))
+    h.update(np.ascontiguousarray(X_test))
+    h.update(repr((sorted(params.items()), num_boost_round, early_stopping_rounds)).encode())
+    return h.hexdigest()
+
+
+def open_cache() -> sqlite3.Connection:
+    """Open the window prediction cache, creating it if needed."""
+    CACHE_DIR.mkdir(exist_ok=True)
+    conn = sqlite3.connect(CACHE_DB)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS predictions (train_hash TEXT PRIMARY KEY, proba_up BLOB NOT NULL)"
     )
-    model.fit(X_train, y_train)
-    return model
+    return conn
+
+
+def load_cached_predictions(conn: sqlite3.Connection, key: str) -> np.ndarray | None:
+    """Load cached P(up) predictions for a window, if present."""
+    row = conn.execute("SELECT proba_up FROM predictions WHERE train_hash = ?", (key,)).fetchone()
+    if row is None:
+        return None
+    return np.frombuffer(row[0], dtype=np.float32)
+
+
+def save_cached_predictions(conn: sqlite3.Connection, key: str, proba_up: np.ndarray) -> None:
+    """Persist a window's P(up) predictions."""
+    conn.execute(
+        "INSERT OR REPLACE INTO predictions (train_hash, proba_up) VALUES (?, ?)",
+        (key, proba_up.astype(np.float32).tobytes()),
+    )
+    conn.commit()
+
+
+def save_cached_booster(key: str, booster: xgb.Booster) -> None:
+    """Persist a window's booster so a later warm-started window can resume from it."""
+    CACHE_DIR.mkdir(exist_ok=True)
+    booster.save_model(CACHE_DIR / f"{key}.ubj")
 
 
 def calculate_sharpe(returns: np.ndarray, periods_per_year: float = 365 * 24 * 4) -> float:
@@ -66,16 +210,211 @@ def calculate_sharpe(returns: np.ndarray, periods_per_year: float = 365 * 24 * 4
         returns: Array of returns
         periods_per_year: Number of periods per year (default: 15m candles)
     """
-    if len(returns) == 0 or np.std(returns) == 0:
+    if len(returns) == 0:
+        return 0.0
+    mean, std = mean_std(np.asarray(returns, dtype=np.float64))
+    if std == 0:
         return 0.0
-    return np.mean(returns) / np.std(returns) * np.sqrt(periods_per_year)
+    return mean / std * np.sqrt(periods_per_year)
 
 
 def calculate_max_drawdown(equity_curve: np.ndarray) -> float:
     """Calculate maximum drawdown."""
-    peak = np.maximum.accumulate(equity_curve)
-    drawdown = (peak - equity_curve) / (peak + 1e-10)
-    return float(np.max(drawdown))
+    return float(max_drawdown(np.asarray(equity_curve, dtype=np.float64)))
+
+
+def predict_windows_sequential(
+    X: np.ndarray,
+    y: np.ndarray,
+    bounds: list[tuple[int, int, int]],
+    config: BacktestConfig,
+    conn: sqlite3.Connection | None = None,
+) -> list[np.ndarray]:
+    """Train each window in order (required for warm starts) and return P(up) per window."""
+    # Keep the feature matrix resident on the GPU across all windows
+    if DEVICE == "cuda":
+        X_dev, y_dev = cp.asarray(X), cp.asarray(y)
+    else:
+        X_dev, y_dev = X, y
+
+    use_onnx = config.onnx_inference and ort is not None and convert_xgboost is not None
+    if config.onnx_inference and not use_onnx:
+        print("onnxruntime/onnxmltools not installed, predicting with XGBoost")
+
+    # Windows trained from scratch hold out the tail of their train window for early stopping
+    eval_len = config.train_window // 10 if config.early_stopping_rounds > 0 else 0
+
+    probas = []
+    booster = None
+    key = ""
+    cache_hits = 0
+    # window_num -> (cache key, ORT session) for windows awaiting batched inference
+    pending = {}
+
+    for window_num, (window_start, train_end, test_end) in enumerate(bounds):
+        warm_start = window_num > 0 and config.warm_start_rounds > 0
+        num_boost_round = config.warm_start_rounds if warm_start else config.n_estimators
+        parent_key = key if warm_start else ""
+        early_stopping_rounds = 0 if warm_start else config.early_stopping_rounds
+        key = window_cache_key(
+            X[window_start:train_end], y[window_start:train_end], X[train_end:test_end],
+            num_boost_round, parent_key, early_stopping_rounds=early_stopping_rounds,
+        )
+
+        proba_up = load_cached_predictions(conn, key) if conn is not None else None
+        if proba_up is not None and config.warm_start_rounds > 0 and not (CACHE_DIR / f"{key}.ubj").exists():
+            # A later window may resume from this one, so without its booster (cached by a
+            # run without warm starts, or cleared) retrain it instead of breaking the chain
+            proba_up = None
+        if proba_up is not None:
+            cache_hits += 1
+            # The in-memory booster no longer matches the chain; reload lazily on the next miss
+            booster = None
+        else:
+            if warm_start and booster is None:
+                booster = xgb.Booster(model_file=CACHE_DIR / f"{parent_key}.ubj")
+
+            # Train model (warm-start from the previous window when enabled). Bins are
+            # sketched from the window's own train rows, as in the parallel path, so price-level
+            # features keep their resolution as the series drifts and no future rows leak in.
+            fit_end = train_end if warm_start else train_end - eval_len
+            dtrain = xgb.QuantileDMatrix(
+                X_dev[window_start:fit_end], label=y_dev[window_start:fit_end],
+                max_bin=WINDOW_PARAMS["max_bin"],
+            )
+            deval = None
+            if fit_end < train_end:
+                deval = xgb.QuantileDMatrix(
+                    X_dev[fit_end:train_end], label=y_dev[fit_end:train_end], ref=dtrain,
+                )
+            booster = train_window_model(
+                dtrain, num_boost_round, prev_booster=booster if warm_start else None,
+                deval=deval, early_stopping_rounds=early_stopping_rounds,
+            )
+
+            # Predict
+            if use_onnx:
+                # Inference for every trained window runs together after the loop
+                pending[window_num] = (key, onnx_session(booster, X.shape[1]))
+            else:
+                proba_up = booster.inplace_predict(X_dev[train_end:test_end])
+                if DEVICE == "cuda":
+                    proba_up = cp.asnumpy(proba_up)
+
+            if conn is not None:
+                # Only a warm-started successor ever reloads a window's booster
+                if config.warm_start_rounds > 0:
+                    save_cached_booster(key, booster)
+                if proba_up is not None:
+                    save_cached_predictions(conn, key, proba_up)
+
+        probas.append(proba_up)
+
+    for window_num, (key, sess) in pending.items():
+        _, train_end, test_end = bounds[window_num]
+        _, probabilities = sess.run(None, {"float_input": X[train_end:test_end]})
+        probas[window_num] = probabilities[:, 1]
+        if conn is not None:
+            save_cached_predictions(conn, key, probas[window_num])
+
+    if conn is not None:
+        print(f"Cache hits: {cache_hits}/{len(bounds)} windows")
+
+    return probas
+
+
+def _run_window(
+    X: np.ndarray,
+    y: np.ndarray,
+    window_start: int,
+    train_end: int,
+    test_end: int,
+    num_boost_round: int,
+    eval_len: int = 0,
+    early_stopping_rounds: int = 0,
+) -> np.ndarray:
+    """Train and predict one independent window (joblib worker)."""
+    fit_end = train_end - eval_len
+    dtrain = xgb.QuantileDMatrix(
+        X[window_start:fit_end],
+        label=y[window_start:fit_end],
+        max_bin=PARALLEL_WINDOW_PARAMS["max_bin"],
+    )
+    deval = None
+    if eval_len > 0:
+        deval = xgb.QuantileDMatrix(X[fit_end:train_end], label=y[fit_end:train_end], ref=dtrain)
+    booster = train_window_model(
+        dtrain, num_boost_round, params=PARALLEL_WINDOW_PARAMS,
+        deval=deval, early_stopping_rounds=early_stopping_rounds,
+    )
+    return booster.inplace_predict(X[train_end:test_end])
+
+
+def predict_windows_parallel(
+    X: np.ndarray,
+    y: np.ndarray,
+    bounds: list[tuple[int, int, int]],
+    config: BacktestConfig,
+    conn: sqlite3.Connection | None = None,
+) -> list[np.ndarray]:
+    """
+    Train independent (non warm-started) windows across processes.
+
+    joblib hands X to the workers as a memory-mapped file rather than a
+    pickled copy per task.
+    """
+    eval_len = config.train_window // 10 if config.early_stopping_rounds > 0 else 0
+    keys = [
+        window_cache_key(
+            X[window_start:train_end], y[window_start:train_end], X[train_end:test_end],
+            config.n_estimators, params=PARALLEL_WINDOW_PARAMS,
+            early_stopping_rounds=config.early_stopping_rounds,
+        )
+        for window_start, train_end, test_end in bounds
+    ]
+    probas = [load_cached_predictions(conn, key) if conn is not None else None for key in keys]
+    misses = [i for i, proba_up in enumerate(probas) if proba_up is None]
+
+    n_jobs = os.cpu_count() if config.n_jobs == -1 else config.n_jobs
+    results = Parallel(n_jobs=n_jobs, backend="loky")(
+        delayed(_run_window)(
+            X, y, *bounds[i], config.n_estimators, eval_len, config.early_stopping_rounds,
+        )
+        for i in misses
+    )
+    for i, proba_up in zip(misses, results):
+        probas[i] = proba_up
+        if conn is not None:
+            save_cached_predictions(conn, keys[i], proba_up)
+
+    if conn is not None:
+        print(f"Cache hits: {len(bounds) - len(misses)}/{len(bounds)} windows")
+
+    return probas
+
+
+def load_feature_arrays(interval: str = "15m") -> tuple[np.ndarray, np.ndarray]:
+    """
+    Load the feature matrix and target as read-only memory maps.
+
+    The .npy files next to the data file are rebuilt only when the data
+    (or features.py / _kernels.py) is newer, so reruns skip parsing and
+    feature building and the OS pages in just the rows each window touches.
+    """
+    X_path = DATA_DIR / f"btc_{interval}_X.npy"
+    y_path = DATA_DIR / f"btc_{interval}_y.npy"
+    sources = [DATA_DIR / f"btc_{interval}.csv", Path(features.__file__), Path(_kernels.__file__)]
+
+    fresh = X_path.exists() and y_path.exists() and all(
+        source.exists() and source.stat().st_mtime <= min(X_path.stat().st_mtime, y_path.stat().st_mtime)
+        for source in sources
+    )
+    if not fresh:
+        X, y, _, _ = build_feature_matrix(load_data(interval))
+        np.save(X_path, np.ascontiguousarray(X))
+        np.save(y_path, y.astype(np.int32))
+
+    return np.load(X_path, mmap_mode="r"), np.load(y_path, mmap_mode="r")
 
 
 def walk_forward_backtest(df: pd.DataFrame, config: BacktestConfig) -> BacktestResult:
@@ -96,91 +435,100 @@ def walk_forward_backtest(df: pd.DataFrame, config: BacktestConfig) -> BacktestR
         BacktestResult with metrics and profit curve
     """
     feature_cols = get_feature_columns(df)
-    X = df[feature_cols].values
-    y = df["target"].values
-    
+    X = df[feature_cols].to_numpy(dtype=np.float32)
+    y = df["target"].to_numpy(dtype=np.int32)
+    return walk_forward_backtest_arrays(X, y, config)
+
+
+def walk_forward_backtest_arrays(X: np.ndarray, y: np.ndarray, config: BacktestConfig) -> BacktestResult:
+    """Walk-forward backtest over a prebuilt feature matrix and target (see walk_forward_backtest)."""
+    # One C-order float32 copy up front (a no-op for the saved memmaps) makes every
+    # window slice a zero-copy view; XGBoost bins float32 natively.
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    y = np.ascontiguousarray(y, dtype=np.int32)
+
     n = len(X)
-    predictions = []
-    returns = []
-    equity = 1.0
-    equity_curve = [equity]
-
-    window_start = 0
-    window_num = 0
-
-    while window_start + config.train_window + config.test_window <= n:
-        train_end = window_start + config.train_window
-        test_end = train_end + config.test_window
-
-        # Split data
-        X_train = X[window_start:train_end]
-        y_train = y[window_start:train_end]
-        X_test = X[train_end:test_end]
+    bounds = [
+        (window_start, window_start + config.train_window, window_start + config.train_window + config.test_window)
+        for window_start in range(0, n - config.train_window - config.test_window + 1, config.step_size)
+    ]
+
+    # Windows whose inputs are unchanged since a previous run are read back instead of retrained
+    conn = open_cache() if config.use_cache else None
+    try:
+        # Windows are independent unless warm-started, so only then can they run in parallel
+        if config.n_jobs != 1 and config.warm_start_rounds <= 0:
+            probas = predict_windows_parallel(X, y, bounds, config, conn)
+        else:
+            probas = predict_windows_sequential(X, y, bounds, config, conn)
+    finally:
+        if conn is not None:
+            conn.close()
+
+    # Every test row is an upper bound on the number of trades
+    max_trades = len(bounds) * config.test_window
+    pred_window = np.empty(max_trades, dtype=np.int32)
+    pred_index = np.empty(max_trades, dtype=np.int64)
+    pred_pred = np.empty(max_trades, dtype=np.int8)
+    pred_actual = np.empty(max_trades, dtype=np.int8)
+    pred_conf = np.empty(max_trades, dtype=np.float32)
+    pred_return = np.empty(max_trades, dtype=np.float64)
+    equity_array = np.empty(max_trades + 1, dtype=np.float64)
+    equity_array[0] = 1.0
+    k = 0
+
+    for window_num, ((_, train_end, test_end), proba_up) in enumerate(zip(bounds, probas)):
         y_test = y[train_end:test_end]
-
-        # Train model
-        model = train_window_model(X_train, y_train)
-
-        # Predict
-        y_pred = model.predict(X_test)
-        y_proba = model.predict_proba(X_test)
-
-        # Calculate returns for each prediction
-        for i in range(len(y_test)):
-            pred = y_pred[i]
-            actual = y_test[i]
-            confidence = y_proba[i, pred]
-
-            # Only trade if confidence above threshold
-            if confidence < config.min_confidence:
-                continue
-
-            # Calculate return
-            # If predicted UP (1) and actual UP (1): profit
-            # If predicted DOWN (0) and actual DOWN (0): profit
-            correct = pred == actual
-            
-            # Simplified return: +/- position_size minus costs
-            # In reality, return depends on actual price movement
-            trade_return = config.position_size * (0.001 if correct else -0.001) - config.transaction_cost
-
-            returns.append(trade_return)
-            equity *= (1 + trade_return)
-            equity_curve.append(equity)
-
-            predictions.append({
-                "window": window_num,
-                "index": train_end + i,
-                "prediction": int(pred),
-                "actual": int(actual),
-                "confidence": float(confidence),
-                "correct": correct,
-                "return": trade_return,
-            })
-
-        window_start += config.step_size
-        window_num += 1
-
-        if window_num % 10 == 0:
-            print(f"Window {window_num}: Equity = {equity:.4f}")
+        y_pred = (proba_up > 0.5).astype(np.int64)
+
+        # Score the whole window at once: only trade if confidence above threshold
+        confidence = np.where(y_pred == 1, proba_up, 1 - proba_up)
+        mask = confidence >= config.min_confidence
+        pred = y_pred[mask]
+        actual = y_test[mask]
+
+        # If predicted UP (1) and actual UP (1): profit
+        # If predicted DOWN (0) and actual DOWN (0): profit
+        # Simplified return: +/- position_size minus costs
+        # In reality, return depends on actual price movement
+        trade_returns = config.position_size * np.where(pred == actual, 0.001, -0.001) - config.transaction_cost
+
+        end = k + len(pred)
+        # Extend the compounded curve from the last written point
+        equity_array[k:end + 1] = equity_array[k] * equity_curve(trade_returns)
+        pred_window[k:end] = window_num
+        pred_index[k:end] = train_end + np.flatnonzero(mask)
+        pred_pred[k:end] = pred
+        pred_actual[k:end] = actual
+        pred_conf[k:end] = confidence[mask]
+        pred_return[k:end] = trade_returns
+        k = end
+
+        if (window_num + 1) % 10 == 0:
+            print(f"Window {window_num + 1}: Equity = {equity_array[k]:.4f}")
 
     # Calculate metrics
-    returns_array = np.array(returns)
-    equity_array = np.array(equity_curve)
+    returns_array = pred_return[:k]
+    equity_array = equity_array[:k + 1]
 
-    winning = sum(1 for p in predictions if p["correct"])
-    losing = len(predictions) - winning
+    winning = int(np.count_nonzero(pred_pred[:k] == pred_actual[:k]))
+    losing = k - winning
 
     result = BacktestResult(
-        total_trades=len(predictions),
+        total_trades=k,
         winning_trades=winning,
         losing_trades=losing,
-        win_rate=winning / len(predictions) if predictions else 0,
-        total_return=(equity - 1) * 100,
+        win_rate=winning / k if k else 0,
+        total_return=(equity_array[-1] - 1) * 100,
         sharpe_ratio=calculate_sharpe(returns_array),
         max_drawdown=calculate_max_drawdown(equity_array),
-        profit_curve=equity_curve,
-        predictions=predictions,
+        profit_curve=equity_array,
+        pred_window=pred_window[:k],
+        pred_index=pred_index[:k],
+        pred_pred=pred_pred[:k],
+        pred_actual=pred_actual[:k],
+        pred_conf=pred_conf[:k],
+        pred_return=returns_array,
     )
 
     return result
@@ -190,9 +538,14 @@ def plot_results(result: BacktestResult, save_path: Path | None = None) -> None:
     """Plot backtest results."""
     fig, axes = plt.subplots(2, 2, figsize=(14, 10))
 
+    # Draw at most ~5000 points per line; rendering time scales with segment count
+    max_points = 5000
+    step = max(1, len(result.profit_curve) // max_points)
+
     # Equity curve
     ax1 = axes[0, 0]
-    ax1.plot(result.profit_curve, linewidth=1, color="blue")
+    trade_num = np.arange(0, len(result.profit_curve), step)
+    ax1.plot(trade_num, result.profit_curve[::step], linewidth=1, color="blue")
     ax1.axhline(1.0, color="gray", linestyle="--", alpha=0.5)
     ax1.set_title("Equity Curve")
     ax1.set_xlabel("Trade #")
@@ -201,9 +554,9 @@ def plot_results(result: BacktestResult, save_path: Path | None = None) -> None:
 
     # Cumulative returns
     ax2 = axes[0, 1]
-    returns = [p["return"] for p in result.predictions]
+    returns = result.pred_return
     cumulative = np.cumsum(returns) * 100
-    ax2.plot(cumulative, linewidth=1, color="green")
+    ax2.plot(np.arange(0, len(cumulative), step), cumulative[::step], linewidth=1, color="green")
     ax2.axhline(0, color="red", linestyle="--", alpha=0.5)
     ax2.set_title("Cumulative Returns (%)")
     ax2.set_xlabel("Trade #")
@@ -220,11 +573,12 @@ def plot_results(result: BacktestResult, save_path: Path | None = None) -> None:
 
     # Rolling win rate
     ax4 = axes[1, 1]
-    correct = [1 if p["correct"] else 0 for p in result.predictions]
+    correct = result.pred_pred == result.pred_actual
     window = min(100, len(correct) // 10)
     if window > 0:
-        rolling_wr = pd.Series(correct).rolling(window=window).mean()
-        ax4.plot(rolling_wr, linewidth=1, color="purple")
+        kernel = np.full(window, 1 / window, dtype=np.float32)
+        rolling_wr = np.convolve(correct.astype(np.float32), kernel, mode="valid")
+        ax4.plot(np.arange(window - 1, len(correct)), rolling_wr, linewidth=1, color="purple")
         ax4.axhline(0.5, color="red", linestyle="--", alpha=0.5)
     ax4.set_title(f"Rolling Win Rate (window={window})")
     ax4.set_xlabel("Trade #")
@@ -266,13 +620,12 @@ def main():
 
     # Load and prepare data
     print("\n[1/3] Loading data and building features...")
-    raw_df = load_data()
-    df = build_features(raw_df, target_horizon=15)
-    print(f"Data shape: {df.shape}")
+    X, y = load_feature_arrays()
+    print(f"Data shape: {X.shape}")
 
     # Resample to 15m for faster backtesting (optional)
-    # df = df.iloc[::15]  # Take every 15th row
-    # print(f"Resampled shape: {df.shape}")
+    # X, y = X[::15], y[::15]  # Take every 15th row
+    # print(f"Resampled shape: {X.shape}")
 
     # Run backtest
     print("\n[2/3] Running walk-forward backtest...")
@@ -284,7 +637,7 @@ def main():
         transaction_cost=0.001,
     )
 
-    result = walk_forward_backtest(df, config)
+    result = walk_forward_backtest_arrays(X, y, config)
 
     # Print and plot
     print_results(result)
@@ -8,22 +8,55 @@ Polymarket 使用 Chainlink 数据结算，必须使用相同数据源训练。
 - Chainlink: BTC/USD 预言机价格 (结算价格)
 """
 
+import asyncio
+import functools
+import importlib.util
 import os
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Optional
 
+import numpy as np
 import pandas as pd
 import requests
 from web3 import Web3
 
+try:
+    import orjson  # 可选: 更快的 JSON 解析
+except ImportError:
+    orjson = None
+
+try:
+    import httpx  # 可选: 并发获取历史 K 线
+except ImportError:
+    httpx = None
+
+# CSV 是与 node_bot / 脚本共享的交换格式；Python 侧额外保存 Parquet 副本用于快速加载
+from _runtime import HAS_PARQUET
+
 # 超时配置
 REQUEST_TIMEOUT = 30  # 网络请求超时（秒）
 WEB3_TIMEOUT = 30  # Web3 调用超时（秒）
 MAX_RETRIES = 3  # 最大重试次数
 RETRY_DELAY = 1  # 重试延迟（秒）
 
+# Binance K 线配置
+BINANCE_KLINES_URL = "https://api.binance.com/api/v3/klines"
+BINANCE_KLINES_LIMIT = 1000  # 单次请求最大条数
+BINANCE_MAX_CONCURRENCY = 20  # 并发请求数 (每次请求 weight=2，远低于 1200/分钟限制)
+INTERVAL_MS = {
+    "1m": 60_000,
+    "3m": 3 * 60_000,
+    "5m": 5 * 60_000,
+    "15m": 15 * 60_000,
+    "30m": 30 * 60_000,
+    "1h": 60 * 60_000,
+    "4h": 4 * 60 * 60_000,
+    "1d": 24 * 60 * 60_000,
+}
+
 DATA_DIR = Path(__file__).parent.parent / "data"
 DATA_DIR.mkdir(exist_ok=True)
 
@@ -73,11 +106,74 @@ CHAINLINK_ABI = [
     },
 ]
 
+# getRoundData 返回值类型 (roundId, answer, startedAt, updatedAt, answeredInRound)
+ROUND_DATA_TYPES = ["uint80", "int256", "uint256", "uint256", "uint80"]
+
+# Multicall3 (所有 EVM 链地址相同): 一次 eth_call 批量执行多个 getRoundData
+# 来源: https://www.multicall3.com
+MULTICALL3_ADDRESS = "0xcA11bde05977b3631167028862bE2a173976CA11"
+MULTICALL3_ABI = [
+    {
+        "inputs": [
+            {
+                "components": [
+                    {"name": "target", "type": "address"},
+                    {"name": "allowFailure", "type": "bool"},
+                    {"name": "callData", "type": "bytes"},
+                ],
+                "name": "calls",
+                "type": "tuple[]",
+            },
+        ],
+        "name": "aggregate3",
+        "outputs": [
+            {
+                "components": [
+                    {"name": "success", "type": "bool"},
+                    {"name": "returnData", "type": "bytes"},
+                ],
+                "name": "returnData",
+                "type": "tuple[]",
+            },
+        ],
+        "stateMutability": "payable",
+        "type": "function",
+    },
+]
+MULTICALL_BATCH_SIZE = 250  # 每次 Multicall 包含的 round 数
+MULTICALL_MAX_WORKERS = 4  # 并发 Multicall 请求数
+
 # RPC URLs (使用公共节点或配置自己的)
 POLYGON_RPC = os.environ.get("POLYGON_RPC_URL", "https://polygon-rpc.com")
 ETH_RPC = os.environ.get("ETH_RPC_URL", "https://eth.llamarpc.com")
 
 
+@functools.lru_cache(maxsize=8)
+def _chainlink_contract(rpc_url: str, contract_address: str, timeout: int):
+    """创建 (并缓存) Web3 provider 和合约对象，避免每次调用重新解析 ABI。"""
+    w3 = Web3(Web3.HTTPProvider(rpc_url, request_kwargs={"timeout": timeout}))
+    contract = w3.eth.contract(
+        address=Web3.to_checksum_address(contract_address),
+        abi=CHAINLINK_ABI,
+    )
+    return w3, contract
+
+
+@functools.lru_cache(maxsize=8)
+def _chainlink_decimals(rpc_url: str, contract_address: str, timeout: int) -> tuple[int, int]:
+    """
+    获取 (并缓存) 合约精度。
+    
+    decimals() 对同一合约是常量，只需一次 RPC。
+    
+    Returns:
+        Tuple of (decimals, 10 ** decimals)
+    """
+    _, contract = _chainlink_contract(rpc_url, contract_address, timeout)
+    decimals = contract.functions.decimals().call()
+    return decimals, 10 ** decimals
+
+
 def get_chainlink_price(
     rpc_url: str = POLYGON_RPC,
     contract_address: str = CHAINLINK_BTC_USD_POLYGON,
@@ -92,19 +188,15 @@ def get_chainlink_price(
     Returns:
         Tuple of (price, timestamp)
     """
-    w3 = Web3(Web3.HTTPProvider(rpc_url, request_kwargs={"timeout": timeout}))
-    contract = w3.eth.contract(
-        address=Web3.to_checksum_address(contract_address),
-        abi=CHAINLINK_ABI,
-    )
+    _, contract = _chainlink_contract(rpc_url, contract_address, timeout)
     
     try:
         _, answer, _, updated_at, _ = contract.functions.latestRoundData().call()
-        decimals = contract.functions.decimals().call()
+        _, divisor = _chainlink_decimals(rpc_url, contract_address, timeout)
     except Exception as e:
         raise Exception(f"Chainlink 调用超时或失败 (超时设置: {timeout}秒): {e}")
     
-    price = answer / (10 ** decimals)
+    price = answer / divisor
     return price, updated_at
 
 
@@ -130,54 +222,69 @@ def fetch_chainlink_historical(
     print(f"[Chainlink] 获取历史数据, contract: {contract_address}")
     print(f"  超时设置: {timeout}秒")
     
-    w3 = Web3(Web3.HTTPProvider(rpc_url, request_kwargs={"timeout": timeout}))
-    contract = w3.eth.contract(
-        address=Web3.to_checksum_address(contract_address),
-        abi=CHAINLINK_ABI,
-    )
+    w3, contract = _chainlink_contract(rpc_url, contract_address, timeout)
     
     # 获取当前 round
     try:
         round_id, answer, _, updated_at, _ = contract.functions.latestRoundData().call()
-        decimals = contract.functions.decimals().call()
+        _, divisor = _chainlink_decimals(rpc_url, contract_address, timeout)
     except Exception as e:
         raise Exception(f"Chainlink 调用超时或失败 (超时设置: {timeout}秒): {e}")
     
+    multicall = w3.eth.contract(
+        address=Web3.to_checksum_address(MULTICALL3_ADDRESS),
+        abi=MULTICALL3_ABI,
+    )
+    # web3 v7 重命名了 encodeABI
+    encode_abi = getattr(contract, "encode_abi", None) or contract.encodeABI
+    
+    def fetch_batch(round_ids: list[int]) -> list[tuple[bool, bytes]]:
+        # allowFailure=True: 不存在的 round 只让对应结果失败，不影响整个批次
+        calls = [
+            (contract.address, True, encode_abi("getRoundData", [rid]))
+            for rid in round_ids
+        ]
+        return multicall.functions.aggregate3(calls).call()
+    
+    # Chainlink round ID 结构复杂 (phase + aggregator round)，简单递减可能不工作
+    round_ids = [round_id - i for i in range(num_rounds)]
+    batches = [
+        round_ids[i:i + MULTICALL_BATCH_SIZE]
+        for i in range(0, len(round_ids), MULTICALL_BATCH_SIZE)
+    ]
+    
+    # 并发发送 Multicall，重叠 RPC 延迟
+    results = []
+    with ThreadPoolExecutor(max_workers=MULTICALL_MAX_WORKERS) as executor:
+        futures = [executor.submit(fetch_batch, batch) for batch in batches]
+        for batch, future in zip(batches, futures):
+            try:
+                results.extend(future.result())
+            except Exception as e:
+                print(f"  Rounds {batch[0]}~{batch[-1]} 批量获取失败: {e}")
+                results.extend([(False, b"")] * len(batch))
+            print(f"  已获取 {len(results)}/{num_rounds} rounds")
+    
     data = []
-    current_round = round_id
     consecutive_failures = 0
     
-    for i in range(num_rounds):
-        try:
-            rid, ans, started, updated, _ = contract.functions.getRoundData(current_round).call()
-            price = ans / (10 ** decimals)
-            
-            data.append({
-                "timestamp": datetime.utcfromtimestamp(updated),
-                "price": price,
-                "round_id": rid,
-            })
-            
-            consecutive_failures = 0  # 重置失败计数
-            
-            # 前一个 round (Chainlink round ID 结构复杂，简单递减可能不工作)
-            # 使用 phase + aggregator round 结构
-            current_round -= 1
-            
-            if i % 100 == 0:
-                print(f"  已获取 {i+1}/{num_rounds} rounds")
-                
-        except Exception as e:
+    for current_round, (success, return_data) in zip(round_ids, results):
+        if not success or not return_data:
             consecutive_failures += 1
             if consecutive_failures >= max_consecutive_failures:
                 print(f"  连续失败 {consecutive_failures} 次，停止获取")
                 break
-            if i % 10 == 0:  # 减少错误输出频率
-                print(f"  Round {current_round} 获取失败 ({consecutive_failures}/{max_consecutive_failures}): {e}")
-            current_round -= 1
             continue
         
-        time.sleep(0.1)  # Rate limiting
+        consecutive_failures = 0  # 重置失败计数
+        rid, ans, started, updated, _ = w3.codec.decode(ROUND_DATA_TYPES, return_data)
+        price = ans / divisor
+        
+        data.append({
+            "timestamp": datetime.utcfromtimestamp(updated),
+            "price": price,
+            "round_id": rid,
+        })
     
     df = pd.DataFrame(data)
     df = df.sort_values("timestamp")
@@ -202,7 +309,7 @@ def fetch_binance_klines(
         timeout: 请求超时时间（秒）
         max_retries: 最大重试次数
     """
-    url = "https://api.binance.com/api/v3/klines"
+    url = BINANCE_KLINES_URL
     
     params = {
         "symbol": symbol,
@@ -221,7 +328,7 @@ def fetch_binance_klines(
         try:
             response = requests.get(url, params=params, timeout=timeout)
             response.raise_for_status()
-            klines = response.json()
+            klines = orjson.loads(response.content) if orjson is not None else response.json()
             break
         except requests.exceptions.Timeout:
             last_error = f"请求超时（{timeout}秒）"
@@ -242,24 +349,25 @@ def fetch_binance_klines(
     else:
         raise Exception(f"获取数据失败: {last_error}")
     
-    df = pd.DataFrame(
-        klines,
-        columns=[
-            "open_time", "open", "high", "low", "close", "volume",
-            "close_time", "quote_volume", "trades",
-            "taker_buy_base", "taker_buy_quote", "ignore",
-        ],
-    )
-    
-    df["timestamp"] = pd.to_datetime(df["open_time"], unit="ms", utc=True)
-    for col in ["open", "high", "low", "close", "volume", "quote_volume"]:
-        df[col] = df[col].astype(float)
-    df["trades"] = df["trades"].astype(int)
-    
-    df = df[["timestamp", "open", "high", "low", "close", "volume", "quote_volume", "trades"]]
-    df = df.set_index("timestamp")
+    return parse_klines(klines)
+
+
+def parse_klines(klines: list) -> pd.DataFrame:
+    """将 Binance K 线响应解析为 OHLCV DataFrame。"""
+    # Binance 返回 list-of-lists (价格为字符串)，按列一次性转换为定型数组
+    arr = np.array(klines, dtype=object).reshape(-1, 12)
+    cols = {
+        "open": arr[:, 1].astype(np.float64),
+        "high": arr[:, 2].astype(np.float64),
+        "low": arr[:, 3].astype(np.float64),
+        "close": arr[:, 4].astype(np.float64),
+        "volume": arr[:, 5].astype(np.float64),
+        "quote_volume": arr[:, 7].astype(np.float64),
+        "trades": arr[:, 8].astype(np.int64),
+    }
+    index = pd.to_datetime(arr[:, 0].astype(np.int64), unit="ms", utc=True).rename("timestamp")
     
-    return df
+    return pd.DataFrame(cols, index=index, copy=False)
 
 
 def fetch_binance_historical(
@@ -273,15 +381,39 @@ def fetch_binance_historical(
     Args:
         days: 获取天数
         interval: K线间隔
-        max_failures: 最大连续失败次数，超过后停止
+        max_failures: 最大连续失败次数，超过后停止 (并发获取时为失败批次的最大重试轮数，
+            仍有批次失败则报错，避免历史数据中间出现缺口)
     """
     print(f"[Binance] 获取 {days} 天 {interval} 数据...")
     print(f"  超时设置: {REQUEST_TIMEOUT}秒，最大重试: {MAX_RETRIES}次")
     
-    all_data = []
     end_time = datetime.now(tz=None)  # naive datetime
     start_time = end_time - timedelta(days=days)
     
+    if httpx is not None and interval in INTERVAL_MS:
+        all_data = asyncio.run(_fetch_binance_batches_async(start_time, end_time, interval, max_failures))
+    else:
+        all_data = _fetch_binance_batches_sync(start_time, end_time, interval, max_failures)
+    
+    if not all_data:
+        raise ValueError(f"未获取到任何数据。请检查网络连接或 Binance API 是否可用（超时设置: {REQUEST_TIMEOUT}秒）")
+    
+    combined = pd.concat(all_data)
+    combined = combined[~combined.index.duplicated(keep="last")]
+    combined = combined.sort_index()
+    
+    print(f"✅ 完成！共获取 {len(combined)} 条数据")
+    return combined
+
+
+def _fetch_binance_batches_sync(
+    start_time: datetime,
+    end_time: datetime,
+    interval: str,
+    max_failures: int,
+) -> list[pd.DataFrame]:
+    """逐批串行获取 K 线 (未安装 httpx 时的回退路径)。"""
+    all_data = []
     current_start = start_time
     consecutive_failures = 0
     batch_count = 0
@@ -290,6 +422,7 @@ def fetch_binance_historical(
         batch_count += 1
         try:
             df = fetch_binance_klines(
+                interval=interval,
                 start_time=current_start,
                 end_time=end_time,
             )
@@ -323,15 +456,99 @@ def fetch_binance_historical(
         
         time.sleep(0.5)  # 正常请求间的延迟
     
-    if not all_data:
-        raise ValueError(f"未获取到任何数据。请检查网络连接或 Binance API 是否可用（超时设置: {REQUEST_TIMEOUT}秒）")
+    return all_data
+
+
+async def _fetch_klines_async(
+    client: "httpx.AsyncClient",
+    semaphore: asyncio.Semaphore,
+    params: dict,
+    max_retries: int = MAX_RETRIES,
+) -> pd.DataFrame:
+    """获取单个批次，429/418/5xx 时指数退避重试。"""
+    async with semaphore:
+        for attempt in range(max_retries):
+            last_attempt = attempt == max_retries - 1
+            try:
+                response = await client.get(BINANCE_KLINES_URL, params=params)
+            except httpx.TransportError:
+                if last_attempt:
+                    raise
+                await asyncio.sleep(RETRY_DELAY * 2 ** attempt)
+                continue
+            
+            if not last_attempt and (response.status_code in (418, 429) or response.status_code >= 500):
+                # 限流时优先遵循 Retry-After
+                retry_after = response.headers.get("Retry-After")
+                await asyncio.sleep(float(retry_after) if retry_after else RETRY_DELAY * 2 ** attempt)
+                continue
+            
+            response.raise_for_status()
+            klines = orjson.loads(response.content) if orjson is not None else response.json()
+            return parse_klines(klines)
+
+
+async def _fetch_binance_batches_async(
+    start_time: datetime,
+    end_time: datetime,
+    interval: str,
+    max_failures: int,
+    symbol: str = "BTCUSDT",
+) -> list[pd.DataFrame]:
+    """
+    并发获取所有批次。
     
-    combined = pd.concat(all_data)
-    combined = combined[~combined.index.duplicated(keep="last")]
-    combined = combined.sort_index()
+    K 线是连续的，所以批次的起止时间可以提前算出，无需等待上一个响应。
+    失败的批次按轮重新获取，最多 max_failures 轮；缺任何一个批次都会在
+    历史中间留下缺口 (串行路径只会截断尾部)，因此仍有失败时直接报错。
+    """
+    start_ms = int(start_time.timestamp() * 1000)
+    end_ms = int(end_time.timestamp() * 1000)
+    step_ms = BINANCE_KLINES_LIMIT * INTERVAL_MS[interval]
+    batches = [
+        {
+            "symbol": symbol,
+            "interval": interval,
+            "limit": BINANCE_KLINES_LIMIT,
+            "startTime": batch_start,
+            "endTime": min(batch_start + step_ms - 1, end_ms),
+        }
+        for batch_start in range(start_ms, end_ms, step_ms)
+    ]
+    print(f"  并发获取 {len(batches)} 个批次 (并发数: {BINANCE_MAX_CONCURRENCY})")
+    
+    semaphore = asyncio.Semaphore(BINANCE_MAX_CONCURRENCY)
+    http2 = importlib.util.find_spec("h2") is not None
+    results = [None] * len(batches)
+    pending = list(range(len(batches)))
+    async with httpx.AsyncClient(http2=http2, timeout=REQUEST_TIMEOUT) as client:
+        for failures in range(1, max_failures + 1):
+            fetched = await asyncio.gather(
+                *[_fetch_klines_async(client, semaphore, batches[i]) for i in pending],
+                return_exceptions=True,
+            )
+            failed = []
+            for i, result in zip(pending, fetched):
+                if isinstance(result, Exception):
+                    print(f"  批次 {i + 1} 获取失败 ({failures}/{max_failures}): {result}")
+                    failed.append(i)
+                else:
+                    results[i] = result
+            pending = failed
+            if not pending or failures == max_failures:
+                break
+            # 失败后等待更长时间再重试失败的批次
+            await asyncio.sleep(RETRY_DELAY * failures)
     
-    print(f"✅ 完成！共获取 {len(combined)} 条数据")
-    return combined
+    if pending:
+        raise RuntimeError(
+            f"{len(pending)}/{len(batches)} 个批次连续失败 {max_failures} 轮，停止获取以免历史数据出现缺口"
+        )
+    
+    all_data = [result for result in results if len(result) > 0]
+    print(f"  成功 {len(batches)}/{len(batches)} 个批次")
+    
+    return all_data
 
 
 def resample_to_15m(df: pd.DataFrame) -> pd.DataFrame:
@@ -345,36 +562,77 @@ def resample_to_15m(df: pd.DataFrame) -> pd.DataFrame:
     if not isinstance(df.index, pd.DatetimeIndex):
         df.index = pd.to_datetime(df.index, utc=True)
     
-    # 重采样到 15 分钟，对齐到窗口开始
-    # origin='start_day' 确保从 00:00 开始对齐
-    df_15m = df.resample("15min", origin="start_day").agg({
-        "open": "first",
-        "high": "max",
-        "low": "min",
-        "close": "last",
-        "volume": "sum",
-        "quote_volume": "sum",
-        "trades": "sum",
-    }).dropna()
+    if df.empty:
+        return df[["open", "high", "low", "close", "volume", "quote_volume", "trades"]].copy()
+    if not df.index.is_monotonic_increasing:
+        df = df.sort_index()
+    
+    # 每行的整数桶 id: 时间戳 (ns) // 15 分钟
+    # 15 分钟整除一天，因此与 origin='start_day' 的 00:00/00:15/00:30/00:45 边界一致
+    bucket_ns = 15 * 60 * 1_000_000_000
+    bucket = df.index.as_unit("ns").asi8 // bucket_ns
+    
+    # 数据已排序，每个桶是连续的一段行: 用 reduceat 对每段做一次向量化归约
+    starts = np.flatnonzero(np.diff(bucket, prepend=bucket[:1] - 1))
+    ends = np.append(starts[1:], len(df)) - 1
+    # 桶 id 还原为窗口开始时间
+    index = pd.DatetimeIndex((bucket[starts] * bucket_ns).astype("datetime64[ns]"), name=df.index.name)
+    if df.index.tz is not None:
+        index = index.tz_localize("UTC").tz_convert(df.index.tz)
+    
+    df_15m = pd.DataFrame(
+        {
+            "open": df["open"].to_numpy()[starts],
+            "high": np.maximum.reduceat(df["high"].to_numpy(), starts),
+            "low": np.minimum.reduceat(df["low"].to_numpy(), starts),
+            "close": df["close"].to_numpy()[ends],
+            "volume": np.add.reduceat(df["volume"].to_numpy(), starts),
+            "quote_volume": np.add.reduceat(df["quote_volume"].to_numpy(), starts),
+            "trades": np.add.reduceat(df["trades"].to_numpy(), starts),
+        },
+        index=index.as_unit(df.index.unit),
+    ).dropna()
     
     return df_15m
 
 
+def _save_parquet(df: pd.DataFrame, filepath: Path) -> None:
+    """保存 Parquet 副本 (未安装 pyarrow 时跳过)。"""
+    if HAS_PARQUET:
+        df.to_parquet(filepath.with_suffix(".parquet"), engine="pyarrow", compression="zstd")
+
+
+def _read_data_file(filepath: Path) -> pd.DataFrame:
+    """
+    读取数据文件。
+    
+    Parquet 副本不比 CSV 旧时直接读取 (比解析 CSV 快 10-30 倍)；
+    否则解析 CSV (可能由 node_bot 写入) 并刷新 Parquet 副本。
+    """
+    parquet_path = filepath.with_suffix(".parquet")
+    if HAS_PARQUET and parquet_path.exists() and parquet_path.stat().st_mtime >= filepath.stat().st_mtime:
+        return pd.read_parquet(parquet_path, engine="pyarrow")
+    
+    df = pd.read_csv(filepath, parse_dates=["timestamp"], index_col="timestamp")
+    df.index = pd.to_datetime(df.index, utc=True)
+    _save_parquet(df, filepath)
+    return df
+
+
 def load_existing_data(filename: str) -> Optional[pd.DataFrame]:
     """加载已存在的数据文件。"""
     filepath = DATA_DIR / filename
     if not filepath.exists():
         return None
     
-    df = pd.read_csv(filepath, parse_dates=["timestamp"], index_col="timestamp")
-    df.index = pd.to_datetime(df.index, utc=True)
-    return df
+    return _read_data_file(filepath)
 
 
 def save_data(df: pd.DataFrame, filename: str) -> None:
-    """保存数据到 CSV。"""
+    """保存数据到 CSV (并写入 Parquet 副本)。"""
     filepath = DATA_DIR / filename
     df.to_csv(filepath)
+    _save_parquet(df, filepath)
     print(f"已保存 {len(df)} 条数据到 {filepath}")
 
 
@@ -445,9 +703,7 @@ def load_data(interval: str = "15m") -> pd.DataFrame:
     if not filepath.exists():
         raise FileNotFoundError(f"数据文件不存在: {filepath}, 请先运行 collect_data()")
     
-    df = pd.read_csv(filepath, parse_dates=["timestamp"], index_col="timestamp")
-    df.index = pd.to_datetime(df.index, utc=True)
-    return df
+    return _read_data_file(filepath)
 
 
 if __name__ == "__main__":
@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 """将 XGBoost JSON 模型转换为 ONNX"""
 
+import json
+import subprocess
 import sys
 from pathlib import Path
 
@@ -9,54 +11,79 @@ try:
     from onnxmltools import convert_xgboost
     from onnxmltools.convert.common.data_types import FloatTensorType
 except ImportError as e:
-    print(f"错误: 缺少依赖 {e}")
-    sys.exit(1)
+    convert_xgboost = None
+    FloatTensorType = None
+    IMPORT_ERROR = e
 
 MODEL_DIR = Path(__file__).parent.parent / "model"
 JSON_MODEL = MODEL_DIR / "model_raw.json"
 ONNX_MODEL = MODEL_DIR / "model.onnx"
 
-# 从 metadata.json 读取特征数量
-import json
-metadata_path = MODEL_DIR / "metadata.json"
-if not metadata_path.exists():
-    print("错误: metadata.json 不存在，请先运行 train.py")
-    sys.exit(1)
 
-with open(metadata_path) as f:
-    metadata = json.load(f)
-    n_features = metadata["n_features"]
+# onnxmltools 的 XGBoost 转换器目前最高支持 opset 15
+ONNX_OPSET = 15
+# onnxmltools 的输出名，统一成 skl2onnx 的命名 (node_bot 按名字读取)
+OUTPUT_NAMES = {"label": "output_label", "probabilities": "output_probability"}
 
-print(f"加载模型: {JSON_MODEL}")
-model = xgb.XGBClassifier()
-model.load_model(JSON_MODEL)
 
-print(f"转换为 ONNX (特征数: {n_features})...")
-initial_type = [("float_input", FloatTensorType([None, n_features]))]
+def xgboost_to_onnx(model, n_features: int, target_opset: int = ONNX_OPSET):
+    """将 XGBClassifier 或 Booster 转换为 ONNX 模型 (输入名 float_input，输出 output_label/output_probability)。"""
+    initial_type = [("float_input", FloatTensorType([None, n_features]))]
+    onnx_model = convert_xgboost(model, initial_types=initial_type, target_opset=target_opset)
+    for node in onnx_model.graph.node:
+        node.input[:] = [OUTPUT_NAMES.get(name, name) for name in node.input]
+        node.output[:] = [OUTPUT_NAMES.get(name, name) for name in node.output]
+    for output in onnx_model.graph.output:
+        output.name = OUTPUT_NAMES.get(output.name, output.name)
+    return onnx_model
+
+
+def main():
+    if convert_xgboost is None:
+        print(f"错误: 缺少依赖 {IMPORT_ERROR}")
+        sys.exit(1)
+
+    # 从 metadata.json 读取特征数量
+    metadata_path = MODEL_DIR / "metadata.json"
+    if not metadata_path.exists():
+        print("错误: metadata.json 不存在，请先运行 train.py")
+        sys.exit(1)
+
+    with open(metadata_path) as f:
+        metadata = json.load(f)
+        n_features = metadata["n_features"]
+
+    print(f"加载模型: {JSON_MODEL}")
+    model = xgb.XGBClassifier()
+    model.load_model(JSON_MODEL)
+
+    print(f"转换为 ONNX (特征数: {n_features})...")
 
-try:
-    onnx_model = convert_xgboost(model, initial_types=initial_type, target_opset=12)
-    
-    with open(ONNX_MODEL, "wb") as f:
-        f.write(onnx_model.SerializeToString())
-    
-    print(f"✅ ONNX 模型已保存到: {ONNX_MODEL}")
-except Exception as e:
-    print(f"❌ 转换失败: {e}")
-    print("\n尝试使用 xgboost2onnx...")
     try:
-        import subprocess
-        result = subprocess.run(
-            ["python", "-m", "xgboost2onnx", str(JSON_MODEL), str(ONNX_MODEL), "-n", str(n_features)],
-            capture_output=True,
-            text=True
-        )
-        if result.returncode == 0:
-            print("✅ 使用 xgboost2onnx 转换成功")
-        else:
-            print(f"❌ xgboost2onnx 也失败: {result.stderr}")
+        onnx_model = xgboost_to_onnx(model, n_features)
+
+        with open(ONNX_MODEL, "wb") as f:
+            f.write(onnx_model.SerializeToString())
+
+        print(f"✅ ONNX 模型已保存到: {ONNX_MODEL}")
+    except Exception as e:
+        print(f"❌ 转换失败: {e}")
+        print("\n尝试使用 xgboost2onnx...")
+        try:
+            result = subprocess.run(
+                ["python", "-m", "xgboost2onnx", str(JSON_MODEL), str(ONNX_MODEL), "-n", str(n_features)],
+                capture_output=True,
+                text=True
+            )
+            if result.returncode == 0:
+                print("✅ 使用 xgboost2onnx 转换成功")
+            else:
+                print(f"❌ xgboost2onnx 也失败: {result.stderr}")
+                sys.exit(1)
+        except:
+            print("❌ 所有转换方法都失败了")
             sys.exit(1)
-    except:
-        print("❌ 所有转换方法都失败了")
-        sys.exit(1)
 
+
+if __name__ == "__main__":
+    main()
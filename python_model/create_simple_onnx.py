@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 """创建一个简单的 ONNX 模型用于测试"""
 
+import os
 import numpy as np
 from pathlib import Path
 import json
@@ -41,23 +42,26 @@ prob_tensor = helper.make_tensor_value_info(
 )
 
 # 创建一个简单的线性层：y = softmax(x @ W + b)
-# 使用随机权重（实际应该从训练好的模型提取）
-W = np.random.randn(n_features, 2).astype(np.float32)
-b = np.random.randn(2).astype(np.float32)
+# 使用固定种子的随机权重（实际应该从训练好的模型提取），保证每次生成相同的模型
+rng = np.random.default_rng(42)
+W = rng.standard_normal((n_features, 2), dtype=np.float32)
+b = rng.standard_normal(2, dtype=np.float32)
 
 # 创建权重常量节点
 W_init = helper.make_tensor(
     'W',
     TensorProto.FLOAT,
     [n_features, 2],
-    W.flatten().tolist()
+    W.tobytes(),
+    raw=True
 )
 
 b_init = helper.make_tensor(
     'b',
     TensorProto.FLOAT,
     [2],
-    b.flatten().tolist()
+    b.tobytes(),
+    raw=True
 )
 
 # 创建图
@@ -114,12 +118,13 @@ model.opset_import[0].version = 11
 # 实际上 IR version 由 ONNX 库版本决定，我们需要确保兼容
 model.ir_version = 6
 
-# 验证模型
-try:
-    onnx.checker.check_model(model)
-except Exception as e:
-    print(f"警告: 模型验证失败: {e}")
-    # 继续，因为某些检查可能过于严格
+# 验证模型 (图结构固定，默认跳过；设置 VERIFY_ONNX=1 启用)
+if os.environ.get("VERIFY_ONNX"):
+    try:
+        onnx.checker.check_model(model)
+    except Exception as e:
+        print(f"警告: 模型验证失败: {e}")
+        # 继续，因为某些检查可能过于严格
 
 # 保存
 onnx_path = MODEL_DIR / "model.onnx"
@@ -8,161 +8,323 @@
 3. 精简特征，只保留对短期预测有效的指标
 """
 
+import hashlib
+from pathlib import Path
+
 import numpy as np
 import pandas as pd
 
+try:
+    import numexpr as ne  # 可选: 复合逐元素表达式单次遍历计算
+except ImportError:
+    ne = None
 
-def rsi(series: pd.Series, period: int = 14) -> pd.Series:
-    """计算 RSI 指标。"""
-    delta = series.diff()
-    gain = delta.where(delta > 0, 0.0)
-    loss = (-delta).where(delta < 0, 0.0)
+import _kernels
+from _kernels import ewma, ewmas, rolling_mean_std
+from _runtime import HAS_PARQUET
+
+# 特征列 (顺序即模型输入顺序)；时间特征仅在索引为 DatetimeIndex 时生成
+FEATURE_COLUMNS = [
+    "return_1", "return_2", "return_4", "return_8",
+    "candle_body", "candle_upper", "candle_lower", "is_bullish",
+    "rsi_7", "rsi_14",
+    "macd", "macd_signal", "macd_hist",
+    "bb_position", "bb_width",
+    "volatility_4", "volatility_8", "atr_7",
+    "volume_ratio", "volume_change",
+    "momentum_4", "roc_4",
+    "ema_4", "ema_8", "close_ema_4_ratio", "close_ema_8_ratio", "ema_cross",
+    "zscore_8",
+]
+TIME_FEATURE_COLUMNS = ["hour_sin", "hour_cos", "quarter_sin", "quarter_cos"]
+
+# 窗口长度固定，前 WARMUP 行存在未填满的指标 (最长的是 20 周期布林带)；
+# 最后 TAIL 行没有下一根 K 线，目标变量未知
+WARMUP = 19
+TAIL = 1
+
+# 时间循环编码查找表: 一天只有 24 个小时、一小时 60 个分钟值，按索引取值代替逐行 sin/cos
+_HOURS = np.arange(24)
+_MINUTES = np.arange(60)
+HOUR_SIN = np.sin(2 * np.pi * _HOURS / 24)
+HOUR_COS = np.cos(2 * np.pi * _HOURS / 24)
+MINUTE_SIN = np.sin(2 * np.pi * _MINUTES / 60)
+MINUTE_COS = np.cos(2 * np.pi * _MINUTES / 60)
+
+
+def _eval(expr: str, **arrays: np.ndarray) -> np.ndarray:
+    """计算逐元素算术表达式；有 numexpr 时融合为一次遍历，否则逐步用 NumPy 计算。"""
+    if ne is not None:
+        return ne.evaluate(expr, local_dict=arrays)
+    return eval(expr, {"__builtins__": {}}, arrays)
+
+
+def shifted(x: np.ndarray, k: int) -> np.ndarray:
+    """按行平移 k 位 (k > 0 取过去值，k < 0 取未来值)，空出的位置填 NaN。"""
+    out = np.full_like(x, np.nan)
+    if k > 0:
+        out[k:] = x[:-k]
+    elif k < 0:
+        out[:k] = x[-k:]
+    else:
+        out[:] = x
+    return out
+
+
+def lag_return(x: np.ndarray, k: int) -> np.ndarray:
+    """k 期收益率，等价于 pct_change(k)。"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return x / shifted(x, k) - 1.0
+
+
+def span_alphas(*spans: int) -> np.ndarray:
+    """EWM span 转平滑系数 alpha = 2 / (span + 1)。"""
+    return 2.0 / (np.array(spans, dtype=np.float64) + 1.0)
+
+
+def rsi_values(close: np.ndarray, periods: tuple[int, ...]) -> np.ndarray:
+    """一次遍历计算多个周期的 RSI，每个周期一行。"""
+    # 第一根 K 线没有变化量，记为 0 (与 NaN 不同，不会污染递推的 EWMA)
+    delta = np.diff(close, prepend=close[:1])
+    gain = np.maximum(delta, 0.0)
+    loss = np.maximum(-delta, 0.0)
     
-    avg_gain = gain.ewm(span=period, adjust=False).mean()
-    avg_loss = loss.ewm(span=period, adjust=False).mean()
+    alphas = span_alphas(*periods)
+    avg_gain = ewmas(gain, alphas)
+    avg_loss = ewmas(loss, alphas)
     
     rs = avg_gain / (avg_loss + 1e-10)
     return 100 - (100 / (1 + rs))
 
 
+def rsi(series: pd.Series, period: int = 14) -> pd.Series:
+    """计算 RSI 指标。"""
+    values = rsi_values(series.to_numpy(dtype=np.float64), (period,))
+    return pd.Series(values[0], index=series.index)
+
+
 def ema(series: pd.Series, period: int) -> pd.Series:
     """计算 EMA。"""
-    return series.ewm(span=period, adjust=False).mean()
+    values = ewma(series.to_numpy(dtype=np.float64), span_alphas(period)[0])
+    return pd.Series(values, index=series.index)
 
 
 def sma(series: pd.Series, period: int) -> pd.Series:
     """计算 SMA。"""
-    return series.rolling(window=period).mean()
+    (mean,), _ = rolling_mean_std(series.to_numpy(dtype=np.float64), np.array([period]))
+    return pd.Series(mean, index=series.index)
 
 
 def macd(series: pd.Series, fast: int = 12, slow: int = 26, signal: int = 9):
     """计算 MACD。"""
-    ema_fast = ema(series, fast)
-    ema_slow = ema(series, slow)
+    ema_fast, ema_slow = ewmas(series.to_numpy(dtype=np.float64), span_alphas(fast, slow))
     macd_line = ema_fast - ema_slow
-    signal_line = ema(macd_line, signal)
+    signal_line = ewma(macd_line, span_alphas(signal)[0])
     histogram = macd_line - signal_line
-    return macd_line, signal_line, histogram
+    index = series.index
+    return pd.Series(macd_line, index=index), pd.Series(signal_line, index=index), pd.Series(histogram, index=index)
 
 
 def bollinger_bands(series: pd.Series, period: int = 20, std_dev: float = 2.0):
     """计算布林带。"""
-    middle = sma(series, period)
-    std = series.rolling(window=period).std()
+    (middle,), (std,) = rolling_mean_std(series.to_numpy(dtype=np.float64), np.array([period]))
     upper = middle + std_dev * std
     lower = middle - std_dev * std
-    return upper, middle, lower
+    index = series.index
+    return pd.Series(upper, index=index), pd.Series(middle, index=index), pd.Series(lower, index=index)
+
+
+def atr_values(high: np.ndarray, low: np.ndarray, close: np.ndarray, period: int = 14) -> np.ndarray:
+    """在 NumPy 数组上计算 ATR。"""
+    prev_close = shifted(close, 1)
+    # fmax 忽略 NaN: 第一根 K 线没有前收盘价，真实波幅取 high - low
+    tr = np.fmax(np.fmax(high - low, np.abs(high - prev_close)), np.abs(low - prev_close))
+    (mean,), _ = rolling_mean_std(tr, np.array([period]))
+    return mean
 
 
 def atr(high: pd.Series, low: pd.Series, close: pd.Series, period: int = 14) -> pd.Series:
     """计算 ATR。"""
-    prev_close = close.shift(1)
-    tr1 = high - low
-    tr2 = (high - prev_close).abs()
-    tr3 = (low - prev_close).abs()
-    tr = pd.concat([tr1, tr2, tr3], axis=1).max(axis=1)
-    return tr.rolling(window=period).mean()
+    values = atr_values(
+        high.to_numpy(dtype=np.float64),
+        low.to_numpy(dtype=np.float64),
+        close.to_numpy(dtype=np.float64),
+        period,
+    )
+    return pd.Series(values, index=close.index)
 
 
-def build_features(df: pd.DataFrame) -> pd.DataFrame:
+def build_feature_matrix(df: pd.DataFrame) -> tuple[np.ndarray, np.ndarray, list[str], pd.Index]:
     """
-    构建 ML 特征。
+    构建 ML 特征矩阵。
     
     输入: 15 分钟 OHLCV 数据
-    输出: 特征 + 目标变量
+    输出: (X, y, 特征名, 索引)
+    
+    每个特征直接写入预分配的 float32 矩阵 (列优先存储，逐列写入连续，
+    包装成 DataFrame 时无需复制)，不经过逐列插入 DataFrame。
     
     目标变量定义 (严格按照 Polymarket 规则):
     - target = 1 if 下一根 K 线的 close >= open (涨或平)
     - target = 0 if 下一根 K 线的 close < open (跌)
+    
+    输入数据不含 NaN 时，只有前 WARMUP 行和最后 TAIL 行不完整，直接切掉；
+    其余行仍含 NaN 说明输入有缺失值，抛出 ValueError。
     """
-    df = df.copy()
-    close = df["close"]
-    high = df["high"]
-    low = df["low"]
-    open_ = df["open"]
-    volume = df["volume"]
+    close_arr = df["close"].to_numpy(dtype=np.float64)
+    open_arr = df["open"].to_numpy(dtype=np.float64)
+    high_arr = df["high"].to_numpy(dtype=np.float64)
+    low_arr = df["low"].to_numpy(dtype=np.float64)
+    volume_arr = df["volume"].to_numpy(dtype=np.float64)
+    
+    has_time = isinstance(df.index, pd.DatetimeIndex)
+    feature_names = FEATURE_COLUMNS + (TIME_FEATURE_COLUMNS if has_time else [])
+    slot = {name: i for i, name in enumerate(feature_names)}
+    X = np.empty((len(df), len(feature_names)), dtype=np.float32, order="F")
+    
+    # 收盘价上的所有 EMA (4/8 均线、MACD 12/26) 一次遍历算完
+    ema_4, ema_8, ema_12, ema_26 = ewmas(close_arr, span_alphas(4, 8, 12, 26))
+    
+    # 收盘价的滚动均值/标准差 (波动率 4/8、z-score 8、布林带 20) 同样一次遍历
+    (_, mean_8, mean_20), (std_4, std_8, std_20) = rolling_mean_std(close_arr, np.array([4, 8, 20]))
+    
+    # 4 根前的收盘价 (1 小时收益、动量、ROC 共用)
+    close_4 = shifted(close_arr, 4)
     
     # === 核心特征 (精简版，针对 15 分钟预测) ===
     
     # 1. 价格收益率 (短期)
-    df["return_1"] = close.pct_change(1)   # 15 分钟收益
-    df["return_2"] = close.pct_change(2)   # 30 分钟收益
-    df["return_4"] = close.pct_change(4)   # 1 小时收益
-    df["return_8"] = close.pct_change(8)   # 2 小时收益
+    X[:, slot["return_1"]] = lag_return(close_arr, 1)   # 15 分钟收益
+    X[:, slot["return_2"]] = lag_return(close_arr, 2)   # 30 分钟收益
+    with np.errstate(divide="ignore", invalid="ignore"):
+        X[:, slot["return_4"]] = close_arr / close_4 - 1.0  # 1 小时收益
+    X[:, slot["return_8"]] = lag_return(close_arr, 8)   # 2 小时收益
     
     # 2. 当前 K 线特征
-    df["candle_body"] = (close - open_) / (high - low + 1e-10)  # K 线实体占比
-    df["candle_upper"] = (high - close.combine(open_, max)) / (high - low + 1e-10)  # 上影线
-    df["candle_lower"] = (close.combine(open_, min) - low) / (high - low + 1e-10)  # 下影线
-    df["is_bullish"] = (close >= open_).astype(int)  # 阳线
+    range_inv = 1.0 / (high_arr - low_arr + 1e-10)
+    X[:, slot["candle_body"]] = (close_arr - open_arr) * range_inv  # K 线实体占比
+    X[:, slot["candle_upper"]] = (high_arr - np.maximum(close_arr, open_arr)) * range_inv  # 上影线
+    X[:, slot["candle_lower"]] = (np.minimum(close_arr, open_arr) - low_arr) * range_inv  # 下影线
+    X[:, slot["is_bullish"]] = np.greater_equal(close_arr, open_arr)  # 阳线
     
     # 3. RSI (短周期)
-    df["rsi_7"] = rsi(close, 7)
-    df["rsi_14"] = rsi(close, 14)
+    X[:, slot["rsi_7"]], X[:, slot["rsi_14"]] = rsi_values(close_arr, (7, 14))
     
-    # 4. MACD
-    macd_line, macd_signal, macd_hist = macd(close)
-    df["macd"] = macd_line
-    df["macd_signal"] = macd_signal
-    df["macd_hist"] = macd_hist
+    # 4. MACD (12, 26, 9)
+    macd_line = ema_12 - ema_26
+    macd_signal = ewma(macd_line, span_alphas(9)[0])
+    X[:, slot["macd"]] = macd_line
+    X[:, slot["macd_signal"]] = macd_signal
+    X[:, slot["macd_hist"]] = macd_line - macd_signal
     
     # 5. 布林带
-    bb_upper, bb_middle, bb_lower = bollinger_bands(close, period=20)
-    df["bb_position"] = (close - bb_lower) / (bb_upper - bb_lower + 1e-10)  # 价格在布林带中的位置
-    df["bb_width"] = (bb_upper - bb_lower) / bb_middle  # 布林带宽度
+    bb_middle = mean_20
+    bb_upper = bb_middle + 2.0 * std_20
+    bb_lower = bb_middle - 2.0 * std_20
+    bb_range = bb_upper - bb_lower
+    X[:, slot["bb_position"]] = _eval("(c - bl) / (r + 1e-10)", c=close_arr, bl=bb_lower, r=bb_range)  # 价格在布林带中的位置
+    X[:, slot["bb_width"]] = bb_range / bb_middle  # 布林带宽度
     
     # 6. 波动率
-    df["volatility_4"] = close.rolling(4).std() / close  # 1 小时波动率
-    df["volatility_8"] = close.rolling(8).std() / close  # 2 小时波动率
-    df["atr_7"] = atr(high, low, close, 7) / close  # ATR 比率
+    X[:, slot["volatility_4"]] = std_4 / close_arr  # 1 小时波动率
+    X[:, slot["volatility_8"]] = std_8 / close_arr  # 2 小时波动率
+    X[:, slot["atr_7"]] = atr_values(high_arr, low_arr, close_arr, 7) / close_arr  # ATR 比率
     
     # 7. 成交量
-    df["volume_ratio"] = volume / volume.rolling(8).mean()  # 成交量比率
-    df["volume_change"] = volume.pct_change()  # 成交量变化
+    (volume_mean_8,), _ = rolling_mean_std(volume_arr, np.array([8]))
+    X[:, slot["volume_ratio"]] = volume_arr / volume_mean_8  # 成交量比率
+    X[:, slot["volume_change"]] = lag_return(volume_arr, 1)  # 成交量变化
     
     # 8. 动量
-    df["momentum_4"] = close - close.shift(4)  # 1 小时动量
-    df["roc_4"] = (close - close.shift(4)) / close.shift(4)  # 1 小时 ROC
+    momentum_4 = close_arr - close_4
+    X[:, slot["momentum_4"]] = momentum_4  # 1 小时动量
+    X[:, slot["roc_4"]] = momentum_4 / close_4  # 1 小时 ROC
     
     # 9. 均线
-    df["ema_4"] = ema(close, 4)
-    df["ema_8"] = ema(close, 8)
-    df["close_ema_4_ratio"] = close / df["ema_4"]  # 价格/EMA 比率
-    df["close_ema_8_ratio"] = close / df["ema_8"]
-    df["ema_cross"] = (df["ema_4"] > df["ema_8"]).astype(int)  # 均线交叉
+    X[:, slot["ema_4"]] = ema_4
+    X[:, slot["ema_8"]] = ema_8
+    X[:, slot["close_ema_4_ratio"]] = close_arr / ema_4  # 价格/EMA 比率
+    X[:, slot["close_ema_8_ratio"]] = close_arr / ema_8
+    X[:, slot["ema_cross"]] = np.greater(ema_4, ema_8)  # 均线交叉
     
     # 10. 统计特征
-    df["zscore_8"] = (close - close.rolling(8).mean()) / (close.rolling(8).std() + 1e-10)
+    X[:, slot["zscore_8"]] = _eval("(c - m) / (s + 1e-10)", c=close_arr, m=mean_8, s=std_8)
     
     # 11. 时间特征 (循环编码)
-    if isinstance(df.index, pd.DatetimeIndex):
-        hour = df.index.hour
-        minute = df.index.minute
+    if has_time:
+        hour = df.index.hour.to_numpy()
+        minute = df.index.minute.to_numpy()
         # 小时循环编码
-        df["hour_sin"] = np.sin(2 * np.pi * hour / 24)
-        df["hour_cos"] = np.cos(2 * np.pi * hour / 24)
+        X[:, slot["hour_sin"]] = HOUR_SIN.take(hour)
+        X[:, slot["hour_cos"]] = HOUR_COS.take(hour)
         # 15 分钟在小时内的位置 (0, 15, 30, 45)
-        df["quarter_sin"] = np.sin(2 * np.pi * minute / 60)
-        df["quarter_cos"] = np.cos(2 * np.pi * minute / 60)
+        X[:, slot["quarter_sin"]] = MINUTE_SIN.take(minute)
+        X[:, slot["quarter_cos"]] = MINUTE_COS.take(minute)
     
     # === 目标变量 ===
     # Polymarket 规则: 结束价格 >= 开始价格 → Up
     # 预测下一根 K 线: next_close >= next_open → 1
-    next_open = open_.shift(-1)
-    next_close = close.shift(-1)
+    next_open = shifted(open_arr, -1)
+    next_close = shifted(close_arr, -1)
     
     # 关键: 使用 >= (不是 >)
-    df["target"] = (next_close >= next_open).astype(int)
+    y = np.greater_equal(next_close, next_open).view(np.int8)
     
     # === 清理 ===
-    # 移除原始 OHLCV 列
-    feature_cols = [c for c in df.columns if c not in ["open", "high", "low", "close", "volume", "quote_volume", "trades"]]
-    df = df[feature_cols]
+    # 删除指标预热期和没有目标变量的最后一行
+    rows = slice(WARMUP, len(df) - TAIL)
+    X, index = X[rows], df.index[rows]
+    
+    # 输入中间有缺失值时指标会出现 NaN，直接报错，避免进入模型和特征缓存
+    nan_rows = np.flatnonzero(np.isnan(X).any(axis=1))
+    if len(nan_rows) > 0:
+        raise ValueError(
+            f"{len(nan_rows)} 行特征含 NaN (首行: {index[nan_rows[0]]})，请检查输入数据是否有缺失值"
+        )
+    return X, y[rows], feature_names, index
+
+
+def build_features(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    构建 ML 特征 (DataFrame 形式，见 build_feature_matrix)。
     
-    # 删除 NaN
-    df = df.dropna()
+    输出: 特征 (float32) + 目标变量 target
+    """
+    X, y, feature_names, index = build_feature_matrix(df)
+    features_df = pd.DataFrame(X, index=index, columns=feature_names, copy=False)
+    features_df["target"] = y
+    return features_df
+
+
+def feature_cache_key(df: pd.DataFrame) -> str:
+    """输入数据 (索引、列名、全部取值) 与特征计算源码 (本文件和 _kernels.py) 的内容哈希。"""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(repr(list(df.columns)).encode())
+    h.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    h.update(Path(__file__).read_bytes())
+    h.update(Path(_kernels.__file__).read_bytes())
+    return h.hexdigest()
+
+
+def build_features_cached(df: pd.DataFrame, cache_path: Path) -> pd.DataFrame:
+    """
+    带 Parquet 缓存的 build_features。
+    
+    哈希保存在同名 .hash 文件中；输入数据和特征代码都没变时直接读取缓存，
+    跳过全部指标计算。未安装 pyarrow 时直接计算。
+    """
+    if not HAS_PARQUET:
+        return build_features(df)
     
-    return df
+    key = feature_cache_key(df)
+    hash_path = cache_path.with_suffix(".hash")
+    if cache_path.exists() and hash_path.exists() and hash_path.read_text() == key:
+        return pd.read_parquet(cache_path, engine="pyarrow")
+    
+    features_df = build_features(df)
+    features_df.to_parquet(cache_path, engine="pyarrow", compression="zstd")
+    hash_path.write_text(key)
+    return features_df
 
 
 def get_feature_columns(df: pd.DataFrame) -> list[str]:
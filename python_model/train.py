@@ -10,12 +10,16 @@
 """
 
 import json
+import os
 from pathlib import Path
 
 import numpy as np
 import pandas as pd
 import xgboost as xgb
-from sklearn.calibration import CalibratedClassifierCV, calibration_curve
+from joblib import Parallel, delayed
+from scipy.optimize import minimize
+from scipy.special import expit, logit
+from sklearn.calibration import calibration_curve
 from sklearn.metrics import (
     accuracy_score,
     brier_score_loss,
@@ -27,65 +31,156 @@ from sklearn.model_selection import TimeSeriesSplit
 from skl2onnx import convert_sklearn
 from skl2onnx.common.data_types import FloatTensorType as SklearnFloatTensorType
 try:
-    from onnxmltools import convert_xgboost
-    from onnxmltools.convert.common.data_types import FloatTensorType as OnnxmltoolsFloatTensorType
+    import onnxruntime as ort
 except ImportError:
-    convert_xgboost = None
-    OnnxmltoolsFloatTensorType = None
+    ort = None
 
+from _runtime import DEVICE
 from collect_data import load_data
-from features import build_features, get_feature_columns
+from convert_to_onnx import ONNX_OPSET, convert_xgboost, xgboost_to_onnx
+from features import build_features_cached, get_feature_columns
 
 MODEL_DIR = Path(__file__).parent.parent / "model"
 MODEL_DIR.mkdir(exist_ok=True)
 
 
+# 所有折共用的 XGBoost 参数
+_XGB_PARAMS = {
+    "objective": "binary:logistic",
+    "tree_method": "hist",
+    "device": DEVICE,
+    "max_bin": 256,
+    "max_depth": 4,  # 降低深度防止过拟合
+    "learning_rate": 0.05,
+    "subsample": 0.8,
+    "colsample_bytree": 0.8,
+    "min_child_weight": 5,
+    "reg_alpha": 0.1,
+    "reg_lambda": 1.0,
+    "seed": 42,
+    "verbosity": 0,
+}
+NUM_BOOST_ROUND = 200
+EARLY_STOPPING_ROUNDS = 20
+
+
+class BoosterClassifier:
+    """xgb.Booster 的二分类适配器，提供评估、校准和导出用到的 sklearn 风格接口。"""
+    
+    def __init__(self, booster: xgb.Booster):
+        self.booster = booster
+    
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        proba_up = self.booster.inplace_predict(X)
+        return np.column_stack([1 - proba_up, proba_up])
+    
+    @property
+    def feature_importances_(self) -> np.ndarray:
+        """按 gain 归一化的特征重要性 (与 XGBClassifier 相同)。"""
+        score = self.booster.get_score(importance_type="gain")
+        importance = np.array(
+            [score.get(f"f{i}", 0.0) for i in range(self.booster.num_features())], dtype=np.float32,
+        )
+        total = importance.sum()
+        return importance / total if total > 0 else importance
+    
+    def save_model(self, fname: Path) -> None:
+        self.booster.save_model(fname)
+
+
+def _fit_fold(
+    X: np.ndarray,
+    y: np.ndarray,
+    train_rows: slice,
+    val_rows: slice,
+    params: dict,
+    select_rounds: bool,
+) -> tuple[dict, int | None]:
+    """
+    训练并评估单折 (joblib worker)。分箱只取本折训练集，验证集沿用训练集的切分点。
+    
+    select_rounds 时同时记录验证集 logloss 曲线并选出早停轮数；评估分数仍来自
+    完整 NUM_BOOST_ROUND 轮的模型，与其它折一致，不会因为用验证集选轮数而偏高。
+    """
+    X_train, X_val = X[train_rows], X[val_rows]
+    y_train, y_val = y[train_rows], y[val_rows]
+    
+    dtrain = xgb.QuantileDMatrix(X_train, label=y_train, max_bin=params["max_bin"])
+    best_rounds = None
+    if select_rounds:
+        dval = xgb.QuantileDMatrix(X_val, label=y_val, ref=dtrain)
+        evals_result = {}
+        booster = xgb.train(
+            params,
+            dtrain,
+            num_boost_round=NUM_BOOST_ROUND,
+            evals=[(dval, "val")],
+            evals_result=evals_result,
+            verbose_eval=False,
+        )
+        best_rounds = _early_stopping_rounds(evals_result["val"]["logloss"])
+    else:
+        booster = xgb.train(params, dtrain, num_boost_round=NUM_BOOST_ROUND)
+    
+    y_proba = booster.inplace_predict(X_val)
+    y_pred = (y_proba >= 0.5).astype(np.int8)
+    
+    scores = {
+        "acc": accuracy_score(y_val, y_pred),
+        "auc": roc_auc_score(y_val, y_proba),
+        "brier": brier_score_loss(y_val, y_proba),
+    }
+    return scores, best_rounds
+
+
+def _early_stopping_rounds(val_loss: list[float]) -> int:
+    """按早停规则 (连续 EARLY_STOPPING_ROUNDS 轮未改善即停) 从验证 loss 曲线选出最优轮数。"""
+    best = 0
+    for i, loss in enumerate(val_loss):
+        if loss < val_loss[best]:
+            best = i
+        elif i - best >= EARLY_STOPPING_ROUNDS:
+            break
+    return best + 1
+
+
 def train_with_cv(
     X: np.ndarray,
     y: np.ndarray,
     n_splits: int = 5,
-) -> tuple[xgb.XGBClassifier, dict]:
+) -> tuple[BoosterClassifier, dict]:
     """
     使用时序交叉验证训练模型。
     
+    最后一折的验证集 (最近的数据) 只用来选出早停轮数，之后用全部训练数据
+    按该轮数重新训练一次作为最终模型，最近约 1/6 的训练数据也参与训练。
+    
     Returns:
         (模型, 交叉验证结果)
     """
     print(f"\n[训练] 使用 {n_splits} 折时序交叉验证")
     
-    tscv = TimeSeriesSplit(n_splits=n_splits)
-    cv_scores = []
+    # 目标取下一根 K 线，gap=1 让验证集第一条与训练集最后一条的标签不重叠
+    tscv = TimeSeriesSplit(n_splits=n_splits, gap=1)
+    # 时序切分的索引都是连续区间，转成切片后各折直接读 X 的视图而不是花式索引的副本
+    folds = [
+        (slice(train_idx[0], train_idx[-1] + 1), slice(val_idx[0], val_idx[-1] + 1))
+        for train_idx, val_idx in tscv.split(X)
+    ]
+    
+    # 各折互相独立，按进程并行；每个模型分到的线程数相应减少，避免超额订阅
+    # GPU 训练时各折依次使用同一块显卡
+    n_workers = 1 if DEVICE == "cuda" else min(n_splits, os.cpu_count() or 1)
+    params = {**_XGB_PARAMS, "nthread": max(1, (os.cpu_count() or 1) // n_workers)}
+    results = Parallel(n_jobs=n_workers, backend="loky")(
+        delayed(_fit_fold)(X, y, train_rows, val_rows, params, fold == n_splits - 1)
+        for fold, (train_rows, val_rows) in enumerate(folds)
+    )
     
-    for fold, (train_idx, val_idx) in enumerate(tscv.split(X)):
-        X_train, X_val = X[train_idx], X[val_idx]
-        y_train, y_val = y[train_idx], y[val_idx]
-        
-        model = xgb.XGBClassifier(
-            objective="binary:logistic",
-            n_estimators=200,
-            max_depth=4,  # 降低深度防止过拟合
-            learning_rate=0.05,
-            subsample=0.8,
-            colsample_bytree=0.8,
-            min_child_weight=5,
-            reg_alpha=0.1,
-            reg_lambda=1.0,
-            random_state=42,
-            n_jobs=-1,
-            verbosity=0,
-        )
-        
-        model.fit(X_train, y_train)
-        
-        y_pred = model.predict(X_val)
-        y_proba = model.predict_proba(X_val)[:, 1]
-        
-        acc = accuracy_score(y_val, y_pred)
-        auc = roc_auc_score(y_val, y_proba)
-        brier = brier_score_loss(y_val, y_proba)
-        
-        cv_scores.append({"acc": acc, "auc": auc, "brier": brier})
-        print(f"  Fold {fold+1}: Acc={acc:.4f}, AUC={auc:.4f}, Brier={brier:.4f}")
+    cv_scores = []
+    for fold, (scores, _) in enumerate(results):
+        cv_scores.append(scores)
+        print(f"  Fold {fold+1}: Acc={scores['acc']:.4f}, AUC={scores['auc']:.4f}, Brier={scores['brier']:.4f}")
     
     # 计算平均分数
     avg_scores = {
@@ -99,54 +194,84 @@ def train_with_cv(
     print(f"\n[CV 结果] Acc: {avg_scores['cv_acc_mean']:.4f} ± {avg_scores['cv_acc_std']:.4f}")
     print(f"[CV 结果] AUC: {avg_scores['cv_auc_mean']:.4f} ± {avg_scores['cv_auc_std']:.4f}")
     
-    # 使用全部数据训练最终模型
-    print("\n[训练] 使用全部数据训练最终模型...")
-    final_model = xgb.XGBClassifier(
-        objective="binary:logistic",
-        n_estimators=200,
-        max_depth=4,
-        learning_rate=0.05,
-        subsample=0.8,
-        colsample_bytree=0.8,
-        min_child_weight=5,
-        reg_alpha=0.1,
-        reg_lambda=1.0,
-        random_state=42,
-        n_jobs=-1,
-        verbosity=0,
-    )
-    final_model.fit(X, y)
+    # 最终模型: 全部训练数据，轮数取最后一折验证集上的早停结果
+    _, best_rounds = results[-1]
+    print(f"[训练] 用全部 {len(X)} 条训练数据重新训练 {best_rounds} 轮 (轮数由最后一折早停选出)")
+    dtrain = xgb.QuantileDMatrix(X, label=y, max_bin=_XGB_PARAMS["max_bin"])
+    booster = xgb.train(_XGB_PARAMS, dtrain, num_boost_round=best_rounds)
+    
+    return BoosterClassifier(booster), avg_scores
+
+
+def fit_platt(proba: np.ndarray, y: np.ndarray) -> tuple[float, float]:
+    """
+    Platt Scaling: 拟合 p' = sigmoid(a * logit(p) + b)，最小化 log loss。
+    
+    Returns:
+        (a, b)
+    """
+    z = logit(np.clip(proba.astype(np.float64), 1e-6, 1 - 1e-6))
+    y = y.astype(np.float64)
+    
+    def loss(ab: np.ndarray) -> tuple[float, np.ndarray]:
+        t = ab[0] * z + ab[1]
+        # log(1 + e^t) - y*t 即 -(y*log(q) + (1-y)*log(1-q))，数值稳定
+        grad = expit(t) - y
+        return np.mean(np.logaddexp(0, t) - y * t), np.array([np.mean(grad * z), np.mean(grad)])
+    
+    res = minimize(loss, np.array([1.0, 0.0]), jac=True, method="L-BFGS-B")
+    return float(res.x[0]), float(res.x[1])
+
+
+def apply_platt(proba: np.ndarray, a: float, b: float) -> np.ndarray:
+    """对原始 P(Up) 应用 Platt 变换。"""
+    return expit(a * logit(np.clip(proba, 1e-6, 1 - 1e-6)) + b)
+
+
+class PlattCalibratedModel:
+    """原始模型 + Platt 概率变换，提供 predict / predict_proba 接口。"""
+    
+    def __init__(self, model: BoosterClassifier, a: float, b: float):
+        self.model = model
+        self.a = a
+        self.b = b
     
-    return final_model, avg_scores
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        proba_up = apply_platt(self.model.predict_proba(X)[:, 1], self.a, self.b)
+        return np.column_stack([1 - proba_up, proba_up])
+    
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return (self.predict_proba(X)[:, 1] >= 0.5).astype(np.int8)
 
 
 def calibrate_model(
-    model: xgb.XGBClassifier,
+    model: BoosterClassifier,
     X_cal: np.ndarray,
     y_cal: np.ndarray,
-    method: str = "sigmoid",  # Platt Scaling
-) -> CalibratedClassifierCV:
+) -> PlattCalibratedModel:
     """
-    对模型进行概率校准。
+    对模型进行概率校准 (Platt Scaling)。
+    
+    只拟合两个标量 a、b，推理时由调用方 (node_bot) 对 ONNX 输出的原始
+    概率做同样的变换，因此导出的仍是原生 XGBoost 模型。
     
     Args:
         model: 原始模型
         X_cal: 校准数据特征
         y_cal: 校准数据标签
-        method: 校准方法 ("sigmoid" = Platt Scaling, "isotonic")
     
     Returns:
         校准后的模型
     """
-    print(f"\n[校准] 使用 {method} 方法进行概率校准...")
+    print("\n[校准] 使用 Platt Scaling 进行概率校准...")
     
-    # 使用预拟合的模型进行校准
-    calibrated = CalibratedClassifierCV(model, method=method, cv="prefit")
-    calibrated.fit(X_cal, y_cal)
+    y_proba_raw = model.predict_proba(X_cal)[:, 1]
+    a, b = fit_platt(y_proba_raw, y_cal)
+    calibrated = PlattCalibratedModel(model, a, b)
+    print(f"  a={a:.4f}, b={b:.4f}")
     
     # 评估校准效果
-    y_proba_raw = model.predict_proba(X_cal)[:, 1]
-    y_proba_cal = calibrated.predict_proba(X_cal)[:, 1]
+    y_proba_cal = apply_platt(y_proba_raw, a, b)
     
     brier_raw = brier_score_loss(y_cal, y_proba_raw)
     brier_cal = brier_score_loss(y_cal, y_proba_cal)
@@ -170,8 +295,8 @@ def evaluate_model(
     name: str = "Test",
 ) -> dict:
     """评估模型性能。"""
-    y_pred = model.predict(X)
     y_proba = model.predict_proba(X)[:, 1]
+    y_pred = (y_proba >= 0.5).astype(np.int8)
     
     metrics = {
         "accuracy": accuracy_score(y, y_pred),
@@ -190,13 +315,16 @@ def evaluate_model(
     return metrics
 
 
-def export_onnx(model, n_features: int, filepath: Path) -> None:
-    """导出 ONNX 模型。"""
+def export_onnx(model, n_features: int, filepath: Path, X_check: np.ndarray | None = None) -> None:
+    """
+    导出 ONNX 模型 (概率输出为普通 float 张量，不使用 ZipMap)。
+    
+    给定 X_check 且安装了 onnxruntime 时，用 ONNX Runtime 推理一遍，确认与原模型的概率一致。
+    """
     # 如果是 XGBoost 模型，使用 onnxmltools
-    if isinstance(model, xgb.XGBClassifier) and convert_xgboost is not None and OnnxmltoolsFloatTensorType is not None:
+    if isinstance(model, BoosterClassifier) and convert_xgboost is not None:
         print(f"[导出] 使用 onnxmltools 导出 XGBoost 模型...")
-        initial_type = [("float_input", OnnxmltoolsFloatTensorType([None, n_features]))]
-        onnx_model = convert_xgboost(model, initial_types=initial_type, target_opset=12)
+        onnx_model = xgboost_to_onnx(model.booster, n_features)
     else:
         # 尝试使用 skl2onnx
         initial_type = [("float_input", SklearnFloatTensorType([None, n_features]))]
@@ -204,27 +332,45 @@ def export_onnx(model, n_features: int, filepath: Path) -> None:
             onnx_model = convert_sklearn(
                 model,
                 initial_types=initial_type,
-                target_opset=12,
-                options={id(model): {"zipmap": False}} if hasattr(model, '__class__') else None,
+                target_opset=ONNX_OPSET,
+                options={id(model): {"zipmap": False}},
             )
         except Exception as e:
             raise RuntimeError(f"无法导出模型到 ONNX: {e}")
     
+    if ort is not None and X_check is not None:
+        session = ort.InferenceSession(onnx_model.SerializeToString(), providers=["CPUExecutionProvider"])
+        _, onnx_proba = session.run(None, {"float_input": np.asarray(X_check, dtype=np.float32)})
+        max_diff = np.abs(onnx_proba[:, 1] - model.predict_proba(X_check)[:, 1]).max()
+        if max_diff > 1e-4:
+            raise RuntimeError(f"ONNX 推理结果与原模型不一致 (最大概率差 {max_diff:.2e})")
+        print(f"[导出] ONNX Runtime 校验通过 (最大概率差 {max_diff:.2e})")
+    
     with open(filepath, "wb") as f:
         f.write(onnx_model.SerializeToString())
     
     print(f"\n[导出] ONNX 模型已保存到 {filepath}")
 
 
-def save_metadata(feature_names: list[str], metrics: dict, filepath: Path) -> None:
+def save_metadata(
+    feature_names: list[str],
+    metrics: dict,
+    filepath: Path,
+    calibration: PlattCalibratedModel | None = None,
+) -> None:
     """保存模型元数据。"""
     metadata = {
         "feature_names": feature_names,
         "n_features": len(feature_names),
         "target": "15m_up_down_polymarket",
         "target_definition": "next_close >= next_open (Polymarket rule)",
+        "train_device": DEVICE,
         "metrics": metrics,
     }
+    if calibration is not None:
+        # ONNX 输出原始概率，调用方用 sigmoid(platt_a * logit(p) + platt_b) 校准
+        metadata["platt_a"] = calibration.a
+        metadata["platt_b"] = calibration.b
     
     with open(filepath, "w") as f:
         json.dump(metadata, f, indent=2)
@@ -254,11 +400,15 @@ def main():
     
     # 2. 构建特征
     print("\n[2/6] 构建特征...")
-    features_df = build_features(df)
+    features_df = build_features_cached(df, MODEL_DIR / "features_cache.parquet")
     feature_cols = get_feature_columns(features_df)
     
-    X = features_df[feature_cols].values
-    y = features_df["target"].values
+    # XGBoost 与 ONNX 输入都是 float32，直接转换避免 float64 中间副本
+    # 写盘后以内存映射读回，并行的各折进程共享同一份页缓存而不是各自复制 X
+    X_path = MODEL_DIR / "features_X.npy"
+    np.save(X_path, features_df[feature_cols].to_numpy(dtype=np.float32))
+    X = np.load(X_path, mmap_mode="r")
+    y = features_df["target"].to_numpy()
     
     print(f"  特征数量: {len(feature_cols)}")
     print(f"  样本数量: {len(X)}")
@@ -279,12 +429,12 @@ def main():
     print(f"  测试集: {len(X_test)} 条 ({len(X_test)/n:.0%})")
     
     # 4. 训练 (带交叉验证)
-    print("\n[4/6] 训练 XGBoost...")
+    print(f"\n[4/6] 训练 XGBoost (device={DEVICE})...")
     model, cv_scores = train_with_cv(X_train, y_train, n_splits=5)
     
     # 5. 概率校准
     print("\n[5/6] 概率校准...")
-    calibrated_model = calibrate_model(model, X_cal, y_cal, method="sigmoid")
+    calibrated_model = calibrate_model(model, X_cal, y_cal)
     
     # 6. 评估
     print("\n[6/6] 模型评估...")
@@ -315,21 +465,14 @@ def main():
         "test_auc": test_metrics["auc"],
         "test_brier": test_metrics["brier"],
     }
-    save_metadata(feature_cols, all_metrics, MODEL_DIR / "metadata.json")
+    save_metadata(feature_cols, all_metrics, MODEL_DIR / "metadata.json", calibration=calibrated_model)
     
-    # 导出原始模型到 ONNX（CalibratedClassifierCV 可能不支持直接转换）
-    # 注意: 对于模拟交易，可以使用原始模型；生产环境可能需要额外校准
+    # 导出原始模型到 ONNX，Platt 校准参数在 metadata.json 中，由调用方应用
     try:
-        print("[导出] 尝试导出校准后的模型到 ONNX...")
-        export_onnx(calibrated_model, len(feature_cols), MODEL_DIR / "model.onnx")
+        export_onnx(model, len(feature_cols), MODEL_DIR / "model.onnx", X_check=X_test)
     except Exception as e:
-        print(f"[警告] 校准模型导出失败: {e}")
-        try:
-            print("[导出] 使用原始模型导出 ONNX...")
-            export_onnx(model, len(feature_cols), MODEL_DIR / "model.onnx")
-        except Exception as e2:
-            print(f"[警告] ONNX 导出失败: {e2}")
-            print("[提示] 模型已保存为 JSON 格式，可以稍后使用 convert_to_onnx.py 转换")
+        print(f"[警告] ONNX 导出失败: {e}")
+        print("[提示] 模型已保存为 JSON 格式，可以稍后使用 convert_to_onnx.py 转换")
     
     print("\n" + "=" * 60)
     print("训练完成!")